@@ -0,0 +1,206 @@
+"""Benchmark suite of the genetic algorithm. It times the grid generation, the
+evaluation, the selection, the crossover & mutation operators (per chromosome
+and batched) and complete runs of the Population on several problem sizes. The
+soft constraint rows are evaluated with each evaluation backend. The plain and
+the memetic GA (with local search) are also compared by the lowest cost they
+reach in the same wall time. The complete runs can be timed with several
+numbers of worker processes (--workers 1 2 4 8 16), their speedup over a single
+worker is part of the output. A timed run includes starting its pool of worker
+processes, which is also timed on its own, so the speedup is given with and
+without it. Every case is seeded and nothing is plotted, so it
+can run headless. The results are written as JSON, which can be compared with
+the results of a previous run to catch regressions:
+
+    python benchmark.py --output new.json --compare old.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from main import Chromosome, Population, Problem, RouletteWheel, crossover_grids, evaluate_generation, generate_grids, init_worker, mutate_grids
+
+# problem sizes (employers, days) and the population sizes used for each one
+SIZES = [(30, 14, [64, 512]), (100, 28, [64, 256]), (200, 91, [32]), (500, 364, [8])]
+QUICK_SIZES = [(30, 14, [64]), (100, 28, [32])]
+
+def bench(results, name, function, repeats, **params):
+    """This function times function() repeats times and appends the min, median
+    and mean wall time (seconds) to the results, along with the given params."""
+    times = []
+    for i in range(repeats):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    results.append(dict(name = name, repeats = repeats, min = min(times), median = statistics.median(times), mean = statistics.mean(times), **params))
+    print("%-28s %-28s median %.6fs" % (name, " ".join(str(k) + "=" + str(v) for k, v in params.items()), results[-1]["median"]), file = sys.stderr)
+
+def bench_size(results, employers, days, pop_sizes, seed, repeats, workers = (1,)):
+    """This function runs every benchmark case on one problem size. The complete
+    runs are timed with each given number of worker processes."""
+    problem = Problem.scaled(employers, days)
+    rng = random.Random(seed)
+    size = dict(employers = employers, days = days)
+    # fewer repeats for the slow per-cell functions of big rosters
+    cell_repeats = max(1, repeats * 420 // (employers * days))
+
+    # grid generation
+    c = Chromosome(0, 0, employers, days, evaluate = False, problem = problem, rng = rng)
+    bench(results, "generateGrid", lambda: c.generateGrid(rng), cell_repeats, **size)
+    bench(results, "generateGridAlternative", lambda: c.generateGridAlternative(rng), cell_repeats, **size)
+    for pop_size in pop_sizes:
+        bench(results, "generate_grids", lambda: generate_grids(pop_size, problem, np.random.default_rng(seed)), repeats, pop_size = pop_size, **size)
+
+    # evaluation of a single chromosome and of a whole generation
+    bench(results, "check_hard_constraint", c.check_hard_constraint, cell_repeats, **size)
+    bench(results, "check_soft_constraints", c.check_soft_constraints, cell_repeats, **size)
+    for pop_size in pop_sizes:
+        grids = np.stack([Chromosome(i, 0, employers, days, evaluate = False, problem = problem, rng = rng).grid for i in range(pop_size)])
+        bench(results, "evaluate_generation", lambda: evaluate_generation(grids, problem.hard_constraint, problem.shift_hours), repeats, pop_size = pop_size, **size)
+        rows = grids.reshape(-1, days)
+        for backend in Problem.BACKENDS:
+            backend_problem = Problem.scaled(employers, days, backend = backend)
+            backend_problem.evaluate_rows(rows[:1]) # compile the scanner / automaton tables
+            bench(results, "evaluate_rows", lambda: backend_problem.evaluate_rows(rows), repeats, backend = backend, pop_size = pop_size, **size)
+
+    # crossover & mutation (always applied), both methods
+    parentA = Chromosome(0, 0, employers, days, problem = problem, rng = rng)
+    parentB = Chromosome(1, 0, employers, days, problem = problem, rng = rng)
+    child = Chromosome(2, 1, employers, days, evaluate = False, problem = problem, rng = rng)
+    for method in (1, 2):
+        bench(results, "crossover", lambda: child.crossover((1.0, method == 1, parentA, parentB), rng), cell_repeats, method = method, **size)
+        bench(results, "mutate", lambda: child.mutate((1.0, method == 1), rng), cell_repeats, method = method, **size)
+    for pop_size in pop_sizes:
+        grids = generate_grids(pop_size, problem, np.random.default_rng(seed))
+        costs = np.arange(pop_size)
+        generator = np.random.default_rng(seed)
+        for method in (1, 2):
+            bench(results, "crossover_grids", lambda: crossover_grids(grids, grids[::-1], costs, costs[::-1], (1.0, method == 1), generator), repeats, method = method, pop_size = pop_size, **size)
+            bench(results, "mutate_grids", lambda: mutate_grids(grids, (1.0, method == 1), generator), repeats, method = method, pop_size = pop_size, **size)
+
+    # complete runs
+    for pop_size in pop_sizes:
+        for count in workers:
+            bench(results, "population_halving", lambda: Population(pop_size, (0.8, True), (0.5, True), -1, problem = problem, seed = seed, report = False, workers = count), 1, pop_size = pop_size, workers = count, **size)
+            bench(results, "population_steady", lambda: Population(pop_size, (0.8, True), (0.5, True), -1, problem = problem, seed = seed, report = False, engine = "steady", max_generations = 10, workers = count), 1, pop_size = pop_size, generations = 10, workers = count, **size)
+        bench(results, "population_steady_batch", lambda: Population(pop_size, (0.8, True), (0.5, True), -1, problem = problem, seed = seed, report = False, engine = "steady", max_generations = 10, batch = True), 1, pop_size = pop_size, generations = 10, **size)
+
+def bench_selection(results, seed, repeats):
+    """This function times the selection of all parent pairs of a generation."""
+    rng = random.Random(seed)
+    for pop_size in (64, 512, 4096):
+        costs = [rng.randint(20000, 80000) for i in range(pop_size)]
+        bench(results, "roulette", lambda: RouletteWheel(costs).pairs(rng, pop_size // 2), repeats, pop_size = pop_size)
+
+def start_pool(workers):
+    """This function starts a pool of worker processes like a Population does,
+    waits until every worker is up and shuts the pool down."""
+    executor = ProcessPoolExecutor(workers, initializer = init_worker, initargs = (4096,))
+    for future in [executor.submit(abs, i) for i in range(workers)]:
+        future.result()
+    executor.shutdown()
+
+def bench_pool(results, workers, repeats):
+    """This function times starting (and stopping) the pool of worker processes
+    of a complete run, for each given number of workers above 1."""
+    for count in workers:
+        if count > 1:
+            bench(results, "pool_start", lambda: start_pool(count), repeats, workers = count)
+
+def bench_memetic(quality, seed, budget, sizes):
+    """This function compares the plain GA with the memetic one (local search on
+    the best childs of each generation) at equal wall time. Both evolve a steady
+    population for budget seconds, the lowest cost found is appended to quality."""
+    for employers, days, pop_sizes in sizes:
+        problem = Problem.scaled(employers, days)
+        for local_search, moves in ((0, 0), (4, 500)):
+            pop = Population(pop_sizes[0], (0.8, True), (0.5, True), -1, problem = problem, seed = seed, report = False, engine = "steady",
+                             max_generations = 10 ** 9, run = False, local_search = local_search, local_search_moves = moves)
+            start = time.perf_counter()
+            while time.perf_counter() - start < budget:
+                pop.step()
+            quality.append(dict(name = "memetic" if local_search else "plain", budget = budget, employers = employers, days = days, pop_size = pop_sizes[0],
+                                local_search = local_search, local_search_moves = moves, generations = pop.generation, best = pop.best_chromosome.cost))
+            print("%-28s %-28s best %d after %d generations" % (quality[-1]["name"], "employers=%d days=%d" % (employers, days), quality[-1]["best"], pop.generation), file = sys.stderr)
+
+def speedups(results):
+    """This function returns the speedup of every complete run with more than
+    one worker process over the same run with a single one. A timed run
+    includes starting its pool of worker processes, so the speedup without the
+    median pool start time (see bench_pool()) is given as well."""
+    def key(result):
+        return tuple(sorted((k, v) for k, v in result.items() if k not in ("repeats", "min", "median", "mean", "workers")))
+    serial = {key(result) : result["median"] for result in results if result.get("workers") == 1 and result["name"] != "pool_start"}
+    pool_start = {result["workers"] : result["median"] for result in results if result["name"] == "pool_start"}
+    speedups = []
+    for result in results:
+        if result.get("workers", 1) > 1 and key(result) in serial:
+            params = {k : v for k, v in result.items() if k not in ("repeats", "min", "median", "mean")}
+            speedups.append(dict(params, speedup = serial[key(result)] / result["median"]))
+            if result["workers"] in pool_start and result["median"] > pool_start[result["workers"]]:
+                speedups[-1]["pool_start"] = pool_start[result["workers"]]
+                speedups[-1]["speedup_without_pool_start"] = serial[key(result)] / (result["median"] - pool_start[result["workers"]])
+            print("%-28s %-28s speedup %.2fx (%.2fx without starting the pool)" % (result["name"], " ".join(str(k) + "=" + str(v) for k, v in params.items() if k != "name"),
+                  speedups[-1]["speedup"], speedups[-1].get("speedup_without_pool_start", float("nan"))), file = sys.stderr)
+    return speedups
+
+def compare(results, baseline, threshold):
+    """This function compares the median times with those of a baseline JSON file.
+    It returns the cases that became slower by more than the threshold factor."""
+    def key(result):
+        return tuple(sorted((k, v) for k, v in result.items() if k not in ("repeats", "min", "median", "mean")))
+    previous = {key(result) : result for result in baseline["results"]}
+    regressions = []
+    for result in results:
+        old = previous.get(key(result))
+        if old is None or old["median"] <= 0:
+            continue
+        ratio = result["median"] / old["median"]
+        print("%-28s %6.2fx %s" % (result["name"], ratio, "REGRESSION" if ratio > threshold else ""), file = sys.stderr)
+        if ratio > threshold:
+            regressions.append(result)
+    return regressions
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Benchmark suite of the genetic algorithm.")
+    parser.add_argument("--seed", type = int, default = 1)
+    parser.add_argument("--repeats", type = int, default = 5)
+    parser.add_argument("--quick", action = "store_true", help = "only the small problem sizes")
+    parser.add_argument("--output", help = "JSON file for the results (default: stdout)")
+    parser.add_argument("--compare", help = "JSON results of a previous run to compare with")
+    parser.add_argument("--threshold", type = float, default = 1.25, help = "slowdown factor reported as a regression")
+    parser.add_argument("--workers", type = int, nargs = "+", default = [1], help = "worker processes of the complete runs, e.g. 1 2 4 8 16")
+    parser.add_argument("--budget", type = float, default = 2.0, help = "seconds of each run of the plain vs memetic GA comparison")
+    args = parser.parse_args(argv)
+
+    results = []
+    bench_pool(results, args.workers, args.repeats)
+    for employers, days, pop_sizes in (QUICK_SIZES if args.quick else SIZES):
+        bench_size(results, employers, days, pop_sizes, args.seed, args.repeats, args.workers)
+    bench_selection(results, args.seed, args.repeats)
+    quality = []
+    bench_memetic(quality, args.seed, args.budget, QUICK_SIZES)
+
+    report = {"meta" : {"python" : platform.python_version(), "numpy" : np.__version__, "platform" : platform.platform(), "cpus" : os.cpu_count(), "seed" : args.seed, "time" : time.time()}, "results" : results, "speedup" : speedups(results), "quality" : quality}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent = 1)
+    else:
+        json.dump(report, sys.stdout, indent = 1)
+
+    if args.compare:
+        with open(args.compare) as f:
+            if compare(results, json.load(f), args.threshold):
+                return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,161 +1,699 @@
+import os
+import json
+import time
+import struct
 import random
-import matplotlib.pyplot as plt
+import bisect
+import hashlib
+import itertools
+import traceback
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 
 class Population:
     """This class represents our chromosome population. It is described
     by a list of generations. Each value of this list contains another 
-    list of the chromosomes of a particular generation."""
+    list of the chromosomes of a particular generation. The stats of every
+    generation are kept in a history list.
 
-    def __init__(self, pop_size, crossover_params, mutation_params, min_gen_improvement, verbose = False):
+    Two engines are available. The "halving" engine creates one child for each
+    2 parents, so every generation is half the size of the previous one and all
+    generations are kept. The "steady" engine keeps a fixed number of
+    chromosomes: the best elitism chromosomes of a generation survive and the
+    rest are replaced by childs. Only the current generation is kept, so memory
+    does not grow with the number of generations."""
+
+    ENGINES = ("halving", "steady")
+    DIVERSITY_METRICS = ("unique", "hamming")
+
+    TRIAL_CHILDS = 64          # childs bred to time the first generation (see trial_child_time())
+    ESTIMATE_MARGIN = 1.5      # margin of the estimated duration of a generation (see estimate_step())
+
+    def __init__(self, pop_size, crossover_params, mutation_params, min_gen_improvement, verbose = False, problem = None, seed = None, workers = 1, run = True, report = True, cache_size = 4096, engine = "halving", max_generations = None, elitism = 2, observers = None, plot = False, batch = False, checkpoint = None, checkpoint_interval = 10, deduplicate = False, diversity = "unique", min_diversity = None, local_search = 0, local_search_moves = 200, time_budget = None, restore = None):
         """This is the constructor of the Population class. The first pop_size
         chromosomes are created instantly and represent the first generation.
-        For each 2 parents a new child is created in a subsequent generation."""
+        For each 2 parents a new child is created in a subsequent generation.
+        Every generation is reported to the observers (see Observer). The
+        options are:
+
+        seed: makes the run reproducible, every child gets its own random
+            generator derived from the seed, its generation and its index.
+        workers: with workers > 1 the childs are created and evaluated in
+            chunks by a pool of processes, giving the same result as the
+            serial run.
+        run: with run = False only the first generation is created and the
+            caller evolves the population with step().
+        report, plot: add a ConsoleReporter and a PlotReporter (showing the
+            graph at the end) to the observers.
+        cache_size: evaluations are memoized in a FitnessCache of cache_size
+            grids (0 disables it), each worker process keeps one of its own.
+        engine: see ENGINES; the steady engine keeps the elitism best
+            chromosomes of every generation.
+        max_generations: stops the run after that many generations (required
+            by the steady engine).
+        batch: creates the childs of a generation all at once in this process,
+            by the batched operators (see breed_generation()).
+        checkpoint, checkpoint_interval: saves the state of the population to
+            the checkpoint path every checkpoint_interval generations (see
+            save()), so the run can be continued by resume().
+        deduplicate: replaces the childs repeating a grid of their generation
+            (see replace_duplicates()).
+        diversity, min_diversity: the diversity of every generation is
+            measured by the given metric (see DIVERSITY_METRICS), the run
+            stops when it falls below min_diversity (if given).
+        local_search, local_search_moves: the best local_search childs of
+            every generation are improved by Chromosome.local_search(), trying
+            local_search_moves moves each.
+        time_budget: seconds, counted from the creation of the population; the
+            run stops when the next generation would not finish in time (see
+            evolve()).
+        restore: used by resume(), takes the place of the first generation."""
+
+        created = time.perf_counter()
+
+        if engine not in self.ENGINES:
+            raise ValueError("unknown engine " + repr(engine) + ", expected one of " + str(self.ENGINES))
+        if engine == "steady" and (max_generations is None or not 0 <= elitism < pop_size):
+            raise ValueError("the steady engine needs max_generations and 0 <= elitism < pop_size")
+        if diversity not in self.DIVERSITY_METRICS:
+            raise ValueError("unknown diversity metric " + repr(diversity) + ", expected one of " + str(self.DIVERSITY_METRICS))
+        if batch and workers > 1:
+            raise ValueError("the batched operators run in a single process, use workers = 1")
 
         # instance variables
         self.pop_size = pop_size
         self.generations = []
+        self.history = []               # (size, lowest, average, highest) of each generation
+        self.generation = 0             # number of the current (last) generation
+        self.best_chromosome = None     # lowest cost chromosome of all generations
+        self.engine = engine
+        self.generation_size = pop_size # fixed size of the generations of the steady engine
+        self.max_generations = max_generations
+        self.elitism = elitism
+        self.batch = batch
+        self.checkpoint = checkpoint
+        self.checkpoint_interval = checkpoint_interval
+        self.deduplicate = deduplicate
+        self.diversity = diversity
+        self.min_diversity = min_diversity
+        self.diversity_history = []     # diversity of each generation (see DIVERSITY_METRICS)
+        self.local_search = local_search
+        self.local_search_moves = local_search_moves
+        self.child_time = None          # estimated seconds to create and evaluate a child (see estimate_step())
+        self.problem = WHPP if problem is None else problem
+        self.crossover_params = crossover_params
+        self.mutation_params = mutation_params
+        self.min_gen_improvement = min_gen_improvement
+        self.verbose = verbose
+        self.observers = [] if observers is None else list(observers)
+        if report: self.observers.append(ConsoleReporter())
+        if plot: self.observers.append(PlotReporter())
+        self.finished = False
+        self.workers = workers
+        self.executor = None
+        self.cache_size = cache_size
+        self.cache = FitnessCache(cache_size) if cache_size > 0 else None
+        self.worker_cache_counters = [0, 0, 0] # hits, misses, evictions of the worker caches
+        if seed is None and workers > 1:
+            seed = random.getrandbits(32) # childs of parallel runs always need their own seeds
+        self.seed = seed
+        self.rng = random if seed is None else random.Random(seed)
 
-        # generate initial population (generation 0)
-        current_gen = 0
-        temp_chromosomes = []
-        for i in range(pop_size):
-            # stats of WHPP problem
-            employers = 30
-            days = 14
-
-            # store chromosome
-            c = Chromosome(i, current_gen, employers, days, verbose = verbose)
-            temp_chromosomes.append(c)
+        if restore is not None:
+            self.restore(*restore)
+        else:
+            # generate initial population (generation 0). All grids are generated at
+            # once and evaluated below, together with the rest of the generation
+            start = time.perf_counter()
+            current_gen = 0
+            grids = generate_grids(pop_size, self.problem, np.random.default_rng(self.rng.getrandbits(64)))
+            temp_chromosomes = [Chromosome.from_grid(i, current_gen, grids[i], self.problem) for i in range(pop_size)]
 
-        # insert generated chromosomes into first generations
-        self.generations.append(temp_chromosomes)
+            # insert generated chromosomes into first generations
+            timings = {"init" : time.perf_counter() - start}
+            self.evaluate(temp_chromosomes, verbose = verbose)
+            timings["evaluation"] = time.perf_counter() - start - timings["init"]
+            self.add_generation(temp_chromosomes, timings, start)
         
         # generate subsequent generations. creates as many childs as 
         # possible (whenever there are at least 2 parents in a previous generation).
-        if self.pop_size <= 1: return
-        while True:
-            i = 0
-            # create as many childs in this generation as possible
-            for i in range(len(self.generations[current_gen]) // 2):
-                temp_parents = self.roulette(current_gen)
-                c = Chromosome(self.pop_size, current_gen + 1, temp_parents[0].employers, temp_parents[0].days, mutation_params = mutation_params, crossover_params = (crossover_params[0], crossover_params[1], temp_parents[0], temp_parents[1]), verbose = verbose)
-                if len(self.generations) >= current_gen + 2:
-                    self.generations[current_gen + 1].append(c)
-                else:
-                    self.generations.append([c])
-                self.pop_size += 1
-            # calculate generation cost improvement over the previous one
-            if min_gen_improvement >= 0:
-                avg_gen_improvement = 0
-                for i in range(len(self.generations[current_gen]) // 2):
-                    avg_gen_improvement += self.generations[current_gen][i].improvement_over_parent
-                avg_gen_improvement /= len(self.generations[current_gen])
-                print("GENERATION " + str(current_gen) + ": "+ str(avg_gen_improvement) + " improvement over previous gen.")
-                if avg_gen_improvement < min_gen_improvement:
-                    break
-            if len(self.generations[current_gen + 1]) == 1:
+        if self.finished or self.pop_size <= 1 or self.max_generations == 0:
+            self.finish()
+            return
+        if run: self.run(None if time_budget is None else time_budget - (time.perf_counter() - created))
+
+    def run(self, time_budget = None):
+        """This function evolves the population until one of the termination
+        conditions is met or the time_budget (seconds, if given) runs out. The
+        observers output the results. The best chromosome found is returned."""
+        for snapshot in self.evolve(time_budget):
+            pass
+        return self.best_chromosome
+
+    def evolve(self, time_budget = None):
+        """This function is a generator evolving the population one generation at
+        a time. It yields a snapshot of the current generation and then of every
+        new one (see snapshot()), so the caller can follow the run and stop it at
+        any point by leaving the loop. With a time_budget (seconds) no generation
+        is started when its estimated duration (see estimate_step()) would exceed
+        the deadline, and the run is finished there with the best chromosome
+        found so far. The worker processes are shut down when the generator is
+        left."""
+        deadline = None if time_budget is None else time.perf_counter() + time_budget
+        try:
+            yield self.snapshot()
+            while not self.finished:
+                if deadline is not None and time.perf_counter() + self.estimate_step() > deadline:
+                    self.finish()
+                    return
+                self.step()
+                yield self.snapshot()
+        finally:
+            self.close()
+
+    def snapshot(self):
+        """This function returns a snapshot of the current generation: its number,
+        its stats and diversity, the best chromosome found so far and whether
+        the run is finished."""
+        size, lowest, average, highest = self.history[-1]
+        return {"generation" : self.generation, "size" : size, "lowest" : lowest, "average" : average, "highest" : highest,
+                "diversity" : self.diversity_history[-1] if self.diversity_history else None, "best" : self.best_chromosome,
+                "finished" : self.finished}
+
+    def estimate_step(self):
+        """This function estimates the seconds the next generation will take: the
+        number of childs it will have times the time per child of the previous
+        generation, with a margin of ESTIMATE_MARGIN. Generation 0 is created at
+        once and tells little about breeding, so before the first generation is
+        bred the time per child comes from a trial (see trial_child_time())."""
+        pool = self.generations[-1]
+        childs = self.generation_size - min(self.elitism, len(pool)) if self.engine == "steady" else len(pool) // 2
+        if self.child_time is None:
+            self.child_time = self.trial_child_time(childs)
+        return self.child_time * childs * self.ESTIMATE_MARGIN
+
+    def trial_child_time(self, childs):
+        """This function returns the seconds per child of the next generation (of
+        the given number of childs), by breeding a trial batch of up to
+        TRIAL_CHILDS childs of the current generation in this process, the same
+        way step() does (selection, breeding and diversity). The fixed time of a
+        generation is shared by fewer childs in the trial, so it rather
+        overestimates. The local search of the generation is timed on one of the
+        childs and shared among all of them. The trial uses a generator of its
+        own and no fitness cache and its childs are dropped, so the run is not
+        affected."""
+        pool = self.generations[-1]
+        if len(pool) < 2 or childs <= 0:
+            return 0.0
+        rng = random.Random(len(pool))
+        count = max(1, min(self.TRIAL_CHILDS, childs // 8))
+        start = time.perf_counter()
+        parents = RouletteWheel([c.cost for c in pool]).pairs(rng, count)
+        if self.batch:
+            trial = breed_generation(self.problem, pool, parents, self.pop_size, self.generation + 1, self.crossover_params, self.mutation_params, np.random.default_rng(rng.getrandbits(64)))
+        else:
+            tasks = [(self.pop_size + i, parents[i][0], parents[i][1], rng.getrandbits(64)) for i in range(count)]
+            trial = breed_children(self.problem, pool, tasks, self.generation + 1, self.crossover_params, self.mutation_params)
+        generation_diversity(trial, self.diversity)
+        child_time = (time.perf_counter() - start) / count
+        if self.local_search > 0:
+            start = time.perf_counter()
+            trial[0].local_search(self.local_search_moves, rng)
+            child_time += (time.perf_counter() - start) * min(self.local_search, childs) / childs
+        return child_time
+
+    def step(self):
+        """This function creates the next generation from the current (last) one.
+        It returns False when the termination conditions are met, after which no
+        more generations are created."""
+
+        if self.finished: return False
+        start = time.perf_counter()
+        current_gen = self.generation
+        if self.workers > 1 and self.executor is None:
+            self.executor = ProcessPoolExecutor(self.workers, initializer = init_worker, initargs = (self.cache_size,))
+
+        # create as many childs in this generation as possible (halving), or
+        # as many as needed to refill the generation next to its elites (steady)
+        pool = self.generations[-1]
+        elites = sorted(pool, key = lambda c: c.cost)[:self.elitism] if self.engine == "steady" else []
+        childs = self.generation_size - len(elites) if self.engine == "steady" else len(pool) // 2
+        temp_parents_list = RouletteWheel([c.cost for c in pool]).pairs(self.rng, childs)
+        timings = {"selection" : time.perf_counter() - start, "crossover" : 0.0, "mutation" : 0.0, "evaluation" : 0.0}
+        temp_chromosomes = self.breed(current_gen, temp_parents_list, self.crossover_params, self.mutation_params, self.executor, timings)
+        duplicates = None
+        if self.deduplicate:
+            middle = time.perf_counter()
+            duplicates = self.replace_duplicates(temp_chromosomes, elites)
+            timings["deduplication"] = time.perf_counter() - middle
+        if self.local_search > 0:
+            middle = time.perf_counter()
+            for c in sorted(temp_chromosomes, key = lambda c: c.cost)[:self.local_search]:
+                c.local_search(self.local_search_moves, self.rng)
+            timings["local_search"] = time.perf_counter() - middle
+        for i in range(len(temp_chromosomes)):
+            temp_chromosomes[i].compare_to_parents(pool[temp_parents_list[i][0]], pool[temp_parents_list[i][1]])
+            if self.verbose: temp_chromosomes[i].describe()
+        self.pop_size += len(temp_chromosomes)
+
+        # calculate generation cost improvement over the previous one
+        avg_gen_improvement = None
+        if self.min_gen_improvement >= 0:
+            avg_gen_improvement = 0
+            for i in range(len(pool) // 2):
+                avg_gen_improvement += pool[i].improvement_over_parent
+            avg_gen_improvement /= len(pool)
+            if avg_gen_improvement < self.min_gen_improvement:
+                self.finished = True
+        self.add_generation(elites + temp_chromosomes, timings, start, avg_gen_improvement, duplicates)
+
+        if len(self.generations[-1]) == 1:
+            self.finished = True
+        if self.min_diversity is not None and self.diversity_history[-1] < self.min_diversity:
+            self.finished = True
+        if self.max_generations is not None and self.generation >= self.max_generations:
+            self.finished = True
+        if self.checkpoint is not None and (self.finished or self.generation % self.checkpoint_interval == 0):
+            self.save(self.checkpoint)
+        self.child_time = (time.perf_counter() - start) / max(1, len(temp_chromosomes))
+        if self.finished: self.finish()
+        return not self.finished
+
+    def finish(self):
+        """This function marks the population as finished, shuts down the worker
+        processes and notifies the observers."""
+        self.finished = True
+        self.close()
+        for observer in self.observers:
+            observer.on_finish(self)
+
+    def close(self):
+        """This function shuts down the worker processes (if any)."""
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def add_generation(self, chromosomes, timings = None, start = None, improvement = None, duplicates = None):
+        """This function makes the given chromosomes the current generation and
+        records its stats and diversity. The steady engine drops the previous
+        generation. A record of the generation (stats, counts, the wall time of
+        each phase, the improvement over the previous generation and the number
+        of duplicates replaced) is sent to the observers."""
+        if self.generations:
+            self.generation += 1
+        if self.engine == "steady":
+            self.generations = [chromosomes]
+        else:
+            self.generations.append(chromosomes)
+        costs = [c.cost for c in chromosomes]
+        self.history.append((len(costs), min(costs), round(sum(costs) / len(costs)), max(costs)))
+        self.diversity_history.append(generation_diversity(chromosomes, self.diversity))
+        best = min(chromosomes, key = lambda c: c.cost)
+        if self.best_chromosome is None or best.cost < self.best_chromosome.cost:
+            self.best_chromosome = best
+
+        if self.observers:
+            size, lowest, average, highest = self.history[-1]
+            record = {"generation" : self.generation, "size" : size, "lowest" : lowest, "average" : average, "highest" : highest,
+                      "feasible" : sum([c.feasible for c in chromosomes]), "created" : self.pop_size, "best" : self.best_chromosome.cost,
+                      "improvement" : improvement, "diversity" : self.diversity_history[-1], "duplicates" : duplicates, "timings" : {} if timings is None else timings,
+                      "wall" : None if start is None else time.perf_counter() - start}
+            if self.cache_size > 0: record["cache"] = self.cache_stats()
+            for observer in self.observers:
+                observer.on_generation(self, record)
+
+    def replace_duplicates(self, chromosomes, others = ()):
+        """This function replaces the given (new) chromosomes whose grid repeats
+        the grid of another chromosome of the generation (including others, e.g.
+        the elites), using an index of the grids by their hash. A duplicate is
+        mutated (always, with the mutation method of the population) until it is
+        unique, DUPLICATE_ATTEMPTS times at most. If that fails it gets a new
+        random grid. Only the rows changed this way are evaluated again. The
+        number of duplicates replaced is returned."""
+
+        index = set([FitnessCache.key(c.grid) for c in others])
+        duplicates = []
+        for c in chromosomes:
+            key = FitnessCache.key(c.grid)
+            if key in index:
+                duplicates.append(c)
+            index.add(key)
+        if not duplicates:
+            return 0
+
+        generator = np.random.default_rng(self.rng.getrandbits(64))
+        pending = duplicates
+        for attempt in range(DUPLICATE_ATTEMPTS):
+            grids = np.stack([c.grid for c in pending])
+            mutate_grids(grids, (1.0, self.mutation_params[1]), generator)
+            remaining = []
+            for c, grid in zip(pending, grids):
+                key = FitnessCache.key(grid)
+                if key in index:
+                    remaining.append(c)
+                    continue
+                index.add(key)
+                c.mark_dirty((grid != c.grid).any(axis = 1))
+                c.grid = grid
+            pending = remaining
+            if not pending:
                 break
-            # proceed to next generation
-            current_gen += 1
-        
-        # outputting results in console & in form of a graph.
+        if pending:
+            grids = generate_grids(len(pending), self.problem, generator)
+            for c, grid in zip(pending, grids):
+                c.grid = grid
+                c.row_costs = None
+                c.dirty_rows = None
+        evaluate_chromosomes(duplicates, self.problem, self.cache)
+        return len(duplicates)
+
+    def save(self, path):
+        """This function saves the state of the population to a checkpoint file
+        (see write_checkpoint()): the kept chromosomes (and the best one) as
+        contiguous arrays, along with the configuration, the history and the state
+        of the random generator. The file is replaced atomically, so a run stopped
+        while saving keeps its previous checkpoint."""
+        chromosomes = [c for generation in self.generations for c in generation]
+        best = next((i for i in range(len(chromosomes)) if chromosomes[i] is self.best_chromosome), len(chromosomes))
+        if best == len(chromosomes):
+            chromosomes.append(self.best_chromosome)
+        problem = self.problem
+        config = {"problem" : {"employers" : problem.employers, "days" : problem.days, "hard_constraint" : problem.hard_constraint,
+                               "shift_hours" : sorted(problem.shift_hours.items()), "rules" : problem.rules, "backend" : problem.backend},
+                  "population" : {"pop_size" : self.generation_size, "crossover_params" : list(self.crossover_params), "mutation_params" : list(self.mutation_params),
+                                  "min_gen_improvement" : self.min_gen_improvement, "verbose" : self.verbose, "seed" : self.seed, "cache_size" : self.cache_size,
+                                  "engine" : self.engine, "max_generations" : self.max_generations, "elitism" : self.elitism, "batch" : self.batch,
+                                  "checkpoint" : self.checkpoint, "checkpoint_interval" : self.checkpoint_interval, "deduplicate" : self.deduplicate,
+                                  "diversity" : self.diversity, "min_diversity" : self.min_diversity, "local_search" : self.local_search,
+                                  "local_search_moves" : self.local_search_moves}}
+        state = {"generation" : self.generation, "next_id" : self.pop_size, "finished" : self.finished, "history" : self.history, "diversity_history" : self.diversity_history,
+                 "generation_sizes" : [len(generation) for generation in self.generations], "best" : best, "rng" : self.rng.getstate()}
+        arrays = {"grids" : np.stack([c.grid for c in chromosomes]), "ids" : np.array([c.id for c in chromosomes], dtype = np.int64),
+                  "generations" : np.array([c.generation for c in chromosomes], dtype = np.int64), "costs" : np.array([c.cost for c in chromosomes], dtype = np.int64),
+                  "feasible" : np.array([c.feasible for c in chromosomes], dtype = bool), "row_costs" : np.stack([c.row_costs for c in chromosomes]).astype(np.int64),
+                  "improvements" : np.array([c.improvement_over_parent for c in chromosomes], dtype = np.float64)}
+        write_checkpoint(path, {"config" : config, "state" : state}, arrays)
+
+    def restore(self, state, arrays):
+        """This function restores the state saved by save(), given the state part
+        of the checkpoint header and its arrays."""
+        chromosomes = []
+        for i in range(len(arrays["ids"])):
+            c = Chromosome.from_grid(int(arrays["ids"][i]), int(arrays["generations"][i]), np.array(arrays["grids"][i]), self.problem,
+                                     int(arrays["costs"][i]), bool(arrays["feasible"][i]), np.array(arrays["row_costs"][i], dtype = Chromosome.ROW_COST_DTYPE))
+            c.improvement_over_parent = float(arrays["improvements"][i])
+            chromosomes.append(c)
+        self.generations = []
+        for size in state["generation_sizes"]:
+            self.generations.append(chromosomes[:size])
+            chromosomes = chromosomes[size:]
+        self.best_chromosome = ([c for generation in self.generations for c in generation] + chromosomes)[state["best"]]
+        self.history = [tuple(stats) for stats in state["history"]]
+        self.diversity_history = list(state.get("diversity_history", []))
+        self.generation = state["generation"]
+        self.pop_size = state["next_id"]
+        self.finished = state["finished"]
+        version, internal, gauss = state["rng"]
+        self.rng.setstate((version, tuple(internal), gauss))
+
+    @classmethod
+    def resume(cls, path, **options):
+        """This function continues a run from a checkpoint file written by save().
+        The population is created with the saved configuration, any of which can
+        be overridden by options (e.g. workers, observers, report or
+        max_generations), and evolves like the uninterrupted run would have."""
+        header, arrays = read_checkpoint(path)
+        problem = dict(header["config"]["problem"])
+        problem["shift_hours"] = {shift : hours for shift, hours in problem["shift_hours"]}
+        kwargs = dict(header["config"]["population"])
+        kwargs["crossover_params"] = tuple(kwargs["crossover_params"])
+        kwargs["mutation_params"] = tuple(kwargs["mutation_params"])
+        kwargs.update(options)
+        return cls(problem = Problem(**problem), restore = (header["state"], arrays), **kwargs)
+
+    def stats(self, generation):
+        """This function returns the size and the lowest, average and highest
+        cost of a particular generation."""
+        return self.history[generation]
+
+    def best(self):
+        """This function returns the chromosome with the lowest cost of the
+        current (last) generation."""
+        return min(self.generations[-1], key = lambda c: c.cost)
+
+    def emigrants(self, count):
+        """This function returns the best count chromosomes of the current (last)
+        generation, to be sent to another population."""
+        return sorted(self.generations[-1], key = lambda c: c.cost)[:count]
+
+    def immigrate(self, immigrants):
+        """This function replaces the worst chromosomes of the current (last)
+        generation with the best of the immigrants coming from another population.
+        At most half of the generation is replaced."""
+        current = self.generations[-1]
+        immigrants = sorted(immigrants, key = lambda c: c.cost)[:len(current) // 2]
+        worst = sorted(range(len(current)), key = lambda i: current[i].cost, reverse = True)
+        for i in range(len(immigrants)):
+            c = immigrants[i]
+            c.id = self.pop_size
+            c.generation = self.generation
+            c.improvement_over_parent = current[worst[i]].improvement_over_parent
+            current[worst[i]] = c
+            self.pop_size += 1
+
+    def summary(self):
+        """This function outputs the results in console."""
         print("\n=============SUMMARY=============")
-        lowest = []; average = []; highest = []
-        generation_axis = []
-        for i in range(current_gen + 2):
-            generation_axis.append(i)
-            lowest.append(min([c.cost for c in self.generations[i]]))
-            average.append(round(sum([c.cost for c in self.generations[i]])/len(self.generations[i])))
-            highest.append(max([c.cost for c in self.generations[i]]))
-            print("Generation " + str(i) + "  [" + str(len(self.generations[i])) + "]\t -> lowest: " + str(lowest[i]) + ", average: " + str(average[i])  + ", highest: " + str(highest[i]))
-        plt.plot(generation_axis, lowest, 'o-b'); plt.plot(generation_axis, average, 'o-g'); plt.plot(generation_axis, highest, 'o-r')
+        for i in range(len(self.history)):
+            size, lowest, average, highest = self.stats(i)
+            print("Generation " + str(i) + "  [" + str(size) + "]\t -> lowest: " + str(lowest) + ", average: " + str(average)  + ", highest: " + str(highest))
+        if self.cache_size > 0:
+            stats = self.cache_stats()
+            print("Fitness cache: " + str(stats["hits"]) + " hits, " + str(stats["misses"]) + " misses, " + str(stats["evictions"]) + " evictions")
+
+    def plot(self):
+        """This function outputs the results in form of a graph. matplotlib is
+        only imported here, so runs without a graph don't load it."""
+        import matplotlib.pyplot as plt
+        generation_axis = list(range(len(self.history)))
+        plt.plot(generation_axis, [stats[1] for stats in self.history], 'o-b'); plt.plot(generation_axis, [stats[2] for stats in self.history], 'o-g'); plt.plot(generation_axis, [stats[3] for stats in self.history], 'o-r')
         plt.legend(['lowest', 'average', 'highest'])
         plt.show()
 
+    def evaluate(self, chromosomes, parents = None, verbose = False):
+        """This function scores a whole generation at once (see evaluate_chromosomes()).
+        The improvement of each chromosome over its parents is stored as well."""
+
+        evaluate_chromosomes(chromosomes, self.problem, self.cache)
+        for i in range(len(chromosomes)):
+            if parents is not None:
+                chromosomes[i].compare_to_parents(parents[i][0], parents[i][1])
+            if verbose: chromosomes[i].describe()
+
+    def breed(self, generation, parents, crossover_params, mutation_params, executor = None, timings = None):
+        """This function creates and evaluates the childs of a generation, one for
+        each pair of parents (indexes in the current generation). In batch mode
+        all of them are created at once by breed_generation(). Otherwise each
+        child is described by a task holding its id, the indexes of its parents
+        and its own seed. Without an executor all tasks run in this process,
+        otherwise they are split in chunks that are sent to the worker processes
+        together with the compact grids of the parents they need. The time
+        spent in crossover, mutation and evaluation is added to timings (summed
+        over the workers)."""
+
+        pool = self.generations[-1]
+        if self.batch:
+            return breed_generation(self.problem, pool, parents, self.pop_size, generation + 1, crossover_params, mutation_params, np.random.default_rng(self.rng.getrandbits(64)), self.cache, timings)
+
+        tasks = []
+        for i in range(len(parents)):
+            seed = None if self.seed is None else child_seed(self.seed, generation + 1, i)
+            tasks.append((self.pop_size + i, parents[i][0], parents[i][1], seed))
+
+        if executor is None:
+            return breed_children(self.problem, pool, tasks, generation + 1, crossover_params, mutation_params, self.cache, timings)
+
+        chunk_size = -(-len(tasks) // (self.workers * 4))
+        futures = []
+        for start in range(0, len(tasks), chunk_size):
+            chunk = tasks[start:start + chunk_size]
+            # ship only the parents used by this chunk, renumbered from zero
+            needed = sorted(set([t[1] for t in chunk] + [t[2] for t in chunk]))
+            local = {needed[i] : i for i in range(len(needed))}
+            chunk = [(t[0], local[t[1]], local[t[2]], t[3]) for t in chunk]
+            futures.append(executor.submit(breed_chunk, self.problem, pack_chromosomes([pool[i] for i in needed]), chunk, generation + 1, crossover_params, mutation_params))
+
+        childs = []
+        for future in futures:
+            packed_childs, cache_counters, chunk_timings = future.result()
+            childs.extend(unpack_chromosomes(self.problem, generation + 1, *packed_childs))
+            for i in range(3):
+                self.worker_cache_counters[i] += cache_counters[i]
+            if timings is not None:
+                for phase in chunk_timings:
+                    timings[phase] += chunk_timings[phase]
+        return childs
+
+    def cache_stats(self):
+        """This function returns the hits, misses and evictions of the fitness
+        cache of this population, together with those of the worker processes."""
+        stats = {"hits" : 0, "misses" : 0, "evictions" : 0}
+        if self.cache is not None:
+            stats = {"hits" : self.cache.hits, "misses" : self.cache.misses, "evictions" : self.cache.evictions}
+        stats["hits"] += self.worker_cache_counters[0]
+        stats["misses"] += self.worker_cache_counters[1]
+        stats["evictions"] += self.worker_cache_counters[2]
+        return stats
+
     def roulette(self, generation): # selection method
         """This function picks two parents from a pool of chromosomes in a particular
         generation. Both of the parents have to be different chromosomes. The roulette
         method takes into account the cost (penalty of soft constraints) of each chromosome
         into account. Lower costs mean a higher change of that chromosome to be picked as 
-        a parent."""
+        a parent. To pick the parents of a whole generation, RouletteWheel.pairs()
+        should be used instead, which builds the wheel only once."""
         
-        # extract costs of a particular generation
-        gen_costs = []
-        for i in range(len(self.generations[generation])):
-            gen_costs.append(1 / self.generations[generation][i].cost)
-
-        # subtract each chromosome's cost by the minimum cost of this generation. 
-        # This increases the contrast between "good" and "bad" parents.
-        min_cost = min(gen_costs)
-        FACTOR = 1.02
-        gen_costs_2 = []
-        for i in range(len(gen_costs)):
-            gen_costs_2.append(gen_costs[i] - (min_cost / FACTOR))
-        sum_costs = sum(gen_costs_2)
-
-        # pick two unique parents
-        parents = []
-        while len(parents) < 2:
-            sum_temp = 0
-            pick = random.uniform(0, sum_costs)
-            for i in range(len(gen_costs_2)):
-                sum_temp +=  gen_costs_2[i]
-                if sum_temp > pick:
-                    if not self.generations[generation][i] in parents:
-                        parents.append(self.generations[generation][i])
-                    break
-        return parents
-    
+        pool = self.generations[generation]
+        a, b = RouletteWheel([c.cost for c in pool]).pairs(self.rng, 1)[0]
+        return [pool[a], pool[b]]
+
+class RouletteWheel:
+    """This class implements the roulette selection over a generation. The weight
+    of each chromosome is the inverse of its cost, subtracted by the minimum
+    inverse cost of the generation (divided by a factor). This increases the
+    contrast between "good" and "bad" parents. The prefix sums of the weights are
+    built once, so each pick is a binary search (O(log n))."""
+
+    FACTOR = 1.02
+    ZERO_COST = 0.5 # a chromosome without penalty weighs as if it cost half of the smallest penalty
+
+    def __init__(self, costs):
+        inverse_costs = [1 / (cost if cost > 0 else self.ZERO_COST) for cost in costs]
+        min_inverse_cost = min(inverse_costs)
+        self.weights = [inverse_cost - (min_inverse_cost / self.FACTOR) for inverse_cost in inverse_costs]
+        self.prefix = list(itertools.accumulate(self.weights))
+        self.total = self.prefix[-1]
+
+    def pick(self, rng, exclude = None):
+        """This function picks the index of a chromosome with probability
+        proportional to its weight. If exclude is given, that chromosome is left
+        out of the wheel (sampling without replacement) instead of being redrawn."""
+        last = len(self.prefix) - 1
+        if exclude is None:
+            return min(bisect.bisect_right(self.prefix, rng.uniform(0, self.total)), last)
+
+        # draw over the wheel without the excluded slice and skip over it
+        start = self.prefix[exclude - 1] if exclude > 0 else 0
+        pick = rng.uniform(0, self.total - self.weights[exclude])
+        if pick < start:
+            return min(bisect.bisect_right(self.prefix, pick, 0, exclude), exclude - 1)
+        i = bisect.bisect_right(self.prefix, pick - start + self.prefix[exclude], exclude + 1)
+        if i > last:
+            i = last if exclude != last else last - 1
+        return i
+
+    def pairs(self, rng, count):
+        """This function picks count pairs of two different parents (indexes)."""
+        pairs = []
+        for i in range(count):
+            a = self.pick(rng)
+            pairs.append((a, self.pick(rng, exclude = a)))
+        return pairs
+
 class Chromosome:
     """This class represents each chromosome, containing, identification 
     information, cost information and grid stats. The timeplan is represented
     as a 2D grid with employers serving as rows and days as columns. The cell
-    value describes the type of shift assigned to an employer a particular day."""
+    value describes the type of shift assigned to an employer a particular day.
+    The grid is a compact uint8 array and the constants of the problem are shared
+    by all chromosomes, so a chromosome only stores what is unique to it. The
+    penalty cost of each employer (row) is cached, so only rows changed by
+    crossover or mutation have to be evaluated again."""
+
+    __slots__ = ("id", "generation", "feasible", "cost", "row_costs", "dirty_rows", "employers", "days", "grid", "problem", "improvement_over_parent")
 
-    def __init__(self, id, generation, employers, days, mutation_params = None, crossover_params = None, verbose = False):
+    ROW_COST_DTYPE = np.int32 # the cost of an employer stays far below 2 ** 31 even for a year
+
+    def __init__(self, id, generation, employers, days, mutation_params = None, crossover_params = None, verbose = False, evaluate = True, problem = None, rng = None, timings = None):
         """This is the constructor of the Chromosome class. All the basic variables are 
         initialized here. In the first generation, a chromosome does not come from any 
         parents. Thus its grid is generated randomly according to the hard constraints. 
         In subsequent genertaions, crossover_params are passed containing information 
-        about its parents and the mutation method used."""
+        about its parents and the mutation method used. Evaluation can be skipped
+        (evaluate = False) when the caller scores a whole generation at once. The
+        random choices are drawn from rng (the random module by default). The time
+        spent in crossover and mutation is added to the timings dict (if given)."""
 
         self.id = id                    # used for identification
         self.generation = generation    # used for identification
         
         self.feasible = True            # used for evaluation of hard constraints
         self.cost = 0                   # used for evaluation of soft constraints
+        self.row_costs = None           # cached soft constraint cost of each employer
+        self.dirty_rows = None          # employers whose cached cost is outdated
 
         self.employers = employers      # chromosome stats
         self.days = days                # chromosome stats
-        self.grid = [[0 for x in range(days)] for y in range(employers)]
+        self.grid = np.zeros((employers, days), dtype = np.uint8)
 
-        self.hard_constraint = [[10, 10, 5, 5, 5, 5, 5], [10, 10, 10, 5, 10, 5, 5], [5, 5, 5, 5, 5, 5, 5]]
-
-        # declare duration of hours for each shift
-        self.max_shifts = 3
-        self.shift_hours = {1 : 8, 2 : 8, 3 : 10}
+        # hard constraint and shift hours are shared by every chromosome of the problem
+        self.problem = WHPP if problem is None else problem
 
         self.improvement_over_parent = 100 # used for termination condition
         
+        rng = random if rng is None else rng
+
         # crossover_params : (parentA, parentB, [index1, index2, ... indexN])
         if crossover_params is None: # Does not perform crossover between parents (first gen only)
-            self.generateGridAlternative()
-            self.check_hard_constraint()   
-            self.check_soft_constraints()
+            self.generateGridAlternative(rng)
+            if evaluate:
+                self.check_hard_constraint()   
+                self.check_soft_constraints()
 
         else: # child is created by parents (subsequent gens)
-            self.crossover(crossover_params)
-            self.mutate(mutation_params)
-            self.check_hard_constraint()   
-            self.check_soft_constraints()
-
-            avg_parents_cost = (crossover_params[2].cost + crossover_params[3].cost) / 2
-            self.improvement_over_parent = (avg_parents_cost - self.cost) / avg_parents_cost
+            start = time.perf_counter()
+            self.crossover(crossover_params, rng)
+            middle = time.perf_counter()
+            self.mutate(mutation_params, rng)
+            if timings is not None:
+                timings["crossover"] += middle - start
+                timings["mutation"] += time.perf_counter() - middle
+            if evaluate:
+                self.check_hard_constraint()   
+                self.check_soft_constraints()
+                self.compare_to_parents(crossover_params[2], crossover_params[3])
         
-        if verbose: self.describe()
+        if verbose and evaluate: self.describe()
         #if verbose: self.print()
 
-    def generateGrid(self):
+    @property
+    def hard_constraint(self):
+        return self.problem.hard_constraint
+
+    @property
+    def max_shifts(self):
+        return self.problem.max_shifts
+
+    @property
+    def shift_hours(self):
+        return self.problem.shift_hours
+
+    @classmethod
+    def from_grid(cls, id, generation, grid, problem, cost = 0, feasible = True, row_costs = None):
+        """This function restores an already evaluated chromosome from its grid,
+        e.g. one that was created in another process."""
+        c = cls.__new__(cls)
+        c.id = id; c.generation = generation
+        c.feasible = feasible; c.cost = cost
+        c.row_costs = row_costs; c.dirty_rows = None
+        c.employers, c.days = grid.shape
+        c.grid = grid; c.problem = problem
+        c.improvement_over_parent = 100
+        return c
+
+    def generateGrid(self, rng = random):
         """This function generates a shift timeplan for the employers. It is used 
         only by the chromosomes of the first generation. In this method, we iterate
         through the initialized grid and we pick random shifts according to the hard 
@@ -174,7 +712,7 @@ class Chromosome:
             for j in range(self.employers):
                 picked = False
                 while picked == False:
-                    pick = 0 if random.randint(0,1) == 0 else random.randint(1, self.max_shifts) # needed for diversity (0.5 chance to pick 0)
+                    pick = 0 if rng.randint(0,1) == 0 else rng.randint(1, self.max_shifts) # needed for diversity (0.5 chance to pick 0)
                     for h in range(len(self.hard_constraint)):
                         if pick == h + 1 and shifts_remaining[h+1] > 0:
                             self.grid[j][i] = pick
@@ -188,7 +726,7 @@ class Chromosome:
             # compatible for repeating weeks
             day_of_week = 0 if day_of_week >= 6 else day_of_week + 1
 
-    def generateGridAlternative(self):
+    def generateGridAlternative(self, rng = random):
         """This is an alternative function of generateGrid(). It generates a shift 
         timeplan for the employers and it is used only by the chromosomes of the 
         first generation. In this method, each shift type is randomly assigned on
@@ -209,7 +747,7 @@ class Chromosome:
             for key in shifts:
                 added = 0
                 while added < shifts[key]:
-                    rand_index = random.randint(0, self.employers - 1)
+                    rand_index = rng.randint(0, self.employers - 1)
                     if not rand_index in indexes.keys():
                         indexes[rand_index] = key
                         added += 1
@@ -221,7 +759,7 @@ class Chromosome:
             # compatible for repeating weeks
             day_of_week = 0 if day_of_week >= 6 else day_of_week + 1
 
-    def crossover(self, crossover_params):
+    def crossover(self, crossover_params, rng = random):
         """This functions applies crossover to a new child chromosome coming from
         two parents. Both of the methods present below involve copying information
         vertically by switching the active parent depending on the indexes generated. 
@@ -235,26 +773,38 @@ class Chromosome:
         parentB = crossover_params[3]
 
         # propability
-        if random.uniform(0, 1) < propability:
+        if rng.uniform(0, 1) < propability:
             if first_method: # method 1 (simpler - max one toggle index)
-                pick = random.randint(1,parentA.days - 1)
+                pick = rng.randint(1,parentA.days - 1)
                 indexes.append(pick)
             else: # method 2 (complex - multiple random crossover points)
                 for i in range(parentA.days):
-                    if random.randint(0, 3) == 0: # 25% chance to store this index
+                    if rng.randint(0, 3) == 0: # 25% chance to store this index
                         indexes.append(i)
             
             # begin crossover procedure
-            activeParent = parentA if random.randint(0,1) == 0 else parentB
+            activeParent = parentA if rng.randint(0,1) == 0 else parentB
             for j in range(self.days):
                 if j in indexes: # if a crossover index is found, then switch active parent
                     activeParent = parentA if activeParent.cost == parentB.cost else parentB
-                for i in range(self.employers):
-                    self.grid[i][j] = activeParent.grid[i][j]
+                self.grid[:, j] = activeParent.grid[:, j]
+
+            # reuse the cached cost of rows copied unchanged from a parent
+            if parentA.row_costs is not None and parentB.row_costs is not None:
+                same_as_A = (self.grid == parentA.grid).all(axis = 1)
+                same_as_B = (self.grid == parentB.grid).all(axis = 1)
+                self.row_costs = np.where(same_as_A, parentA.row_costs, parentB.row_costs)
+                self.dirty_rows = ~(same_as_A | same_as_B)
+                self.cost = int(self.row_costs.sum())
         else:
-            self.grid = parentA.grid if random.randint(0,1) == 1 else parentB.grid
+            # share the grid of one parent as a read-only view (copied on the first write)
+            activeParent = parentA if rng.randint(0,1) == 1 else parentB
+            self.grid = activeParent.grid.view()
+            self.grid.flags.writeable = False
+            self.row_costs = activeParent.row_costs
+            self.cost = activeParent.cost
 
-    def mutate(self, mutation_params):
+    def mutate(self, mutation_params, rng = random):
         """This function applies mutation to a new child chromosome coming from
         two parents. Both of the methods present below involve making a few changes
         after a crossover is applied. Mutation changes can only be done vertically 
@@ -265,45 +815,127 @@ class Chromosome:
         propability = mutation_params[0]
         first_method = mutation_params[1]
 
-        if random.uniform(0, 1) < propability:
+        if rng.uniform(0, 1) < propability:
             if first_method == 1:# method 1, random vertical swaps
                 for j in range(self.days):
-                    swaps = random.randint(0, self.employers // 15)
+                    swaps = rng.randint(0, self.employers // 15)
                     for i in range(swaps):
-                        swap_index_1 = random.randint(0, self.employers - 1)
-                        swap_index_2 = random.randint(0, self.employers - 1)
-                        temp_shift = self.grid[swap_index_1][j]
-                        self.grid[swap_index_1][j] = self.grid[swap_index_2][j]
-                        self.grid[swap_index_2][j] = temp_shift
+                        swap_index_1 = rng.randint(0, self.employers - 1)
+                        swap_index_2 = rng.randint(0, self.employers - 1)
+                        grid = self.writable_grid()
+                        if grid[swap_index_1, j] != grid[swap_index_2, j]:
+                            self.mark_dirty([swap_index_1, swap_index_2])
+                        grid[[swap_index_1, swap_index_2], j] = grid[[swap_index_2, swap_index_1], j]
             else: # method 2, inversion of order of shifts in a day
                 for j in range(self.days):
-                    if random.randint(0, 4): # around 20% chance
-                        shifts = [row[j] for row in self.grid]
-                        shifts.reverse()
-                        for i in range(len(shifts)):
-                            self.grid[i][j] = shifts[i]
+                    if rng.randint(0, 4): # around 20% chance
+                        grid = self.writable_grid()
+                        self.mark_dirty(np.flatnonzero(grid[:, j] != grid[::-1, j]))
+                        grid[:, j] = grid[::-1, j]
+
+    def local_search(self, moves, rng = random):
+        """This function improves an evaluated chromosome by hill climbing. Each
+        move swaps the shifts of two random employers in a random day, which
+        keeps the grid feasible. Only the two changed rows are evaluated (by the
+        compiled scanner of the rules) and the move is kept if it lowers their
+        cost, otherwise it is undone. The decrease of the cost is returned."""
+
+        scan = self.problem.scanner()
+        grid = self.grid.tolist()
+        row_costs = self.row_costs.tolist()
+        changed = False
+        for move in range(moves):
+            j = rng.randrange(self.days)
+            a = rng.randrange(self.employers)
+            b = rng.randrange(self.employers)
+            if grid[a][j] == grid[b][j]:
+                continue
+            grid[a][j], grid[b][j] = grid[b][j], grid[a][j]
+            cost_a = scan(grid[a])
+            cost_b = scan(grid[b])
+            if cost_a + cost_b < row_costs[a] + row_costs[b]:
+                row_costs[a] = cost_a
+                row_costs[b] = cost_b
+                changed = True
+            else:
+                grid[a][j], grid[b][j] = grid[b][j], grid[a][j]
+
+        if not changed:
+            return 0
+        previous = self.cost
+        self.grid = np.array(grid, dtype = np.uint8)
+        self.row_costs = np.array(row_costs, dtype = self.ROW_COST_DTYPE)
+        self.dirty_rows = None
+        self.cost = sum(row_costs)
+        return previous - self.cost
+
+    def writable_grid(self):
+        """This function implements the copy-on-write of a grid shared with a
+        parent. The grid is copied the first time it is about to be changed."""
+        if not self.grid.flags.writeable:
+            self.grid = self.grid.copy()
+        return self.grid
+
+    def mark_dirty(self, rows):
+        """This function marks the given employers (rows) as changed, so that their
+        cached cost is evaluated again by the next update_cost()."""
+        if self.row_costs is None:
+            return
+        if self.dirty_rows is None:
+            self.dirty_rows = np.zeros(self.employers, dtype = bool)
+        self.dirty_rows[rows] = True
+
+    def stale_rows(self):
+        """This function returns the indexes of the employers (rows) whose cost is
+        not cached or has been invalidated by crossover or mutation."""
+        if self.row_costs is None:
+            return np.arange(self.employers)
+        if self.dirty_rows is None:
+            return np.arange(0)
+        return np.flatnonzero(self.dirty_rows)
+
+    def apply_row_costs(self, rows, costs):
+        """This function stores the freshly evaluated costs of the given rows. The
+        difference from their previous cached costs is applied to the total cost."""
+        if self.row_costs is None:
+            self.row_costs = np.asarray(costs, dtype = self.ROW_COST_DTYPE)
+            self.cost = int(self.row_costs.sum())
+        elif len(rows) > 0:
+            row_costs = self.row_costs.copy() # the cache may be shared with a parent
+            self.cost += int(np.sum(costs) - row_costs[rows].sum())
+            row_costs[rows] = costs
+            self.row_costs = row_costs
+        self.dirty_rows = None
+
+    def update_cost(self):
+        """This function is the incremental alternative of check_soft_constraints().
+        Only the rows returned by stale_rows() are evaluated, the cost of the rest
+        is taken from the cache."""
+        rows = self.stale_rows()
+        self.apply_row_costs(rows, self.problem.evaluate_rows(self.grid[rows]))
 
     def check_hard_constraint(self):
         """This function checks the generated grid's feasibility. The result is
         stored in a boolean feasible variable."""
 
         self.feasible = True
+        grid = self.grid.tolist()
         day_of_week = 0 # used for repeating weeks
         for j in range(self.days):
             # create dict to store shift day_of_week
-            self.employers_per_shift = {}
+            employers_per_shift = {}
 
             # initialize 
             for i in range(self.max_shifts + 1):
-                self.employers_per_shift[i] = 0
+                employers_per_shift[i] = 0
 
             # store shift day_of_week in dict
             for i in range(self.employers):
-                self.employers_per_shift[self.grid[i][j]] += 1
+                employers_per_shift[grid[i][j]] += 1
             
             # check if chromosome meets hard constraint
             for m in range(len(self.hard_constraint)):
-                if self.hard_constraint[m][day_of_week] != self.employers_per_shift[m + 1]:
+                if self.hard_constraint[m][day_of_week] != employers_per_shift[m + 1]:
                     self.feasible = False
             day_of_week = 0 if day_of_week >= 6 else day_of_week + 1
 
@@ -311,159 +943,23 @@ class Chromosome:
         """This functions evaluates the soft constrains of the WHPP. This consists
         of eleven (11) individual tests associated with a penalty cost. The sum of
         these consts are stored in a cost variable representing the total penalty
-        cost of a chromosome. The checks are done separatedly so new ones can be
-        easily inserted as needed."""
+        cost of a chromosome. The tests are described by the rule table of the
+        problem (see WHPP_RULES), so new ones can be easily inserted as needed.
+        The table is compiled into a scanner checking all of them in a single
+        pass over the days of each employer."""
 
-        costs = []
-
-        # 1. max 70 hours of work (cost = 1000)
-        max_work_hours = 70
-        cost = 1000
+        scan = self.problem.scanner()
         total_cost = 0
-        for i in range(len(self.grid)):
-            sum_work_hours = 0
-            for j in range(len(self.grid[0])):
-                if self.grid[i][j] != 0:
-                    sum_work_hours += self.shift_hours[self.grid[i][j]]
-            if sum_work_hours > max_work_hours:
-                total_cost += cost
-        
-        # 2. max 7 consecutive days of work (cost = 1000)
-        consecutive_days = 7
-        cost = 1000
-        for i in range(self.employers):
-            count = 0
-            for j in range(self.days):
-                if count > consecutive_days:
-                    total_cost += cost
-                    count = 0
-                else:
-                    count = count + 1 if self.grid[i][j] != 0 else 0
-
-        # 3. max 4 consecutive night shifts (cost = 1000)
-        consecutive_night_shifts = 4
-        cost = 1000
-        for i in range(self.employers):
-            count = 0
-            for j in range(self.days):
-                if count > consecutive_night_shifts:
-                    total_cost += cost
-                    count = 0
-                else:
-                    count = count + 1 if self.grid[i][j] == 3 else 0
-
-        # 4. avoid night shift of a day with a morning shift of the next day (cost = 1000)
-        avoid_shift = (3, 1)
-        cost = 1000
-        for i in range(self.employers):
-            for j in range(self.days - 1):
-                if self.grid[i][j] == avoid_shift[0] and self.grid[i][j+1] == avoid_shift[1]:
-                    total_cost += cost
-
-        # 5. avoid afteroon shift of a day with a morning shift of the next day (cost = 800)
-        avoid_shift = (2, 1)
-        cost = 800
-        for i in range(self.employers):
-            for j in range(self.days - 1):
-                if self.grid[i][j] == avoid_shift[0] and self.grid[i][j+1] == avoid_shift[1]:
-                    total_cost += cost
-
-        # 6. avoid night shift of a day with an afteroon shift of the next day (cost = 800)
-        avoid_shift = (3, 2)
-        cost = 800
-        for i in range(self.employers):
-            for j in range(self.days - 1):
-                if self.grid[i][j] == avoid_shift[0] and self.grid[i][j+1] == avoid_shift[1]:
-                    total_cost += cost
-        
-        # 7. at least 2 days off after 4 consecutive days of night shifts (cost = 100)
-        consecutive_night_shifts = 4
-        days_off = 2
-        cost = 100
-        for i in range(self.employers):
-            for j in range(self.days - (consecutive_night_shifts + days_off - 1)):
-                temp_consecutive_night_shifts = 0
-                for k in range(consecutive_night_shifts):
-                    if self.grid[i][j+k] == 3:
-                        temp_consecutive_night_shifts += 1
-                if (temp_consecutive_night_shifts == consecutive_night_shifts and (self.grid[i][j+consecutive_night_shifts] != 0 or self.grid[i][j+consecutive_night_shifts+1] != 0)):
-                    total_cost += cost
-
-        # 8. at least 2 days off after 7 days of work (cost = 100)
-        consecutive_days = 7
-        days_off = 2
-        cost = 100
-        for i in range(self.employers):
-            for j in range(self.days - (consecutive_days + days_off - 1)):
-                temp_consecutive_days = 0
-                for k in range(consecutive_days):
-                    if self.grid[i][j+k] != 0:
-                        temp_consecutive_days += 1
-                if temp_consecutive_days == consecutive_days and (self.grid[i][j+temp_consecutive_days] != 0 or self.grid[i][j+temp_consecutive_days+1] != 0):
-                    total_cost += cost
-
-        # 9. avoid day off - work - day off (cost = 1)
-        cost = 1
-        for i in range(self.employers):
-            check = 0
-            for j in range(self.days):
-                if check == 0:
-                    if self.grid[i][j] != 0:
-                        check = 1
-                elif check == 1:
-                    if self.grid[i][j] == 0:
-                        check = 2
-                    else:
-                        check = 0
-                else:
-                    if self.grid[i][j] != 0:
-                        total_cost += cost
-                    check = 0
-
-        # 10. avoid work - day off - work (cost = 1)
-        cost = 1
-        for i in range(self.employers):
-            check = 0
-            for j in range(self.days):
-                if check == 0:
-                    if self.grid[i][j] == 0:
-                        check = 1
-                elif check == 1:
-                    if self.grid[i][j] != 0:
-                        check = 2
-                    else:
-                        check = 0
-                else:
-                    if self.grid[i][j] == 0:
-                        total_cost += cost
-                    check = 0
-
-        # 11. max 1 weekend of work (cost = 1)
-        max_work_weekends = 1
-        cost = 1
-        for i in range(self.employers):
-            day_of_week = 0
-            weekends_worked = 0
-            saturday_worked = False
-            sunday_worked = False
-            for j in range(self.days):
-                if day_of_week == 5 and self.grid[i][j] != 0:
-                    saturday_worked = True
-                if day_of_week == 6 and self.grid[i][j] != 0:
-                    sunday_worked = True
-                if saturday_worked and sunday_worked:
-                    weekends_worked += 1
-                    if weekends_worked > 1:
-                        total_cost += cost
-                if day_of_week >= 6:
-                    day_of_week = 0
-                    saturday_worked = False
-                    sunday_worked = False
-                else:
-                    day_of_week += 1
-
+        for row in self.grid.tolist():
+            total_cost += scan(row)
         self.cost = total_cost
       
+    def compare_to_parents(self, parentA, parentB):
+        """This function calculates the improvement of an evaluated child over the
+        average cost of its parents. It is used for the termination condition."""
+        avg_parents_cost = (parentA.cost + parentB.cost) / 2
+        self.improvement_over_parent = (avg_parents_cost - self.cost) / avg_parents_cost if avg_parents_cost > 0 else 0
+
     def print(self):
         """This function performs an output of a chromosome's grid. It's 
         used mainly as a diagnostic tool."""
@@ -478,16 +974,991 @@ class Chromosome:
         the verbose arguement."""
         print("Chromosome " + str(self.id) + "[" + str(self.generation) + "], feasible: " + str(self.feasible) + ", penalty cost: " + str(self.cost) + ((", improvement: " + str(round(self.improvement_over_parent, 3)) + "%") if self.generation > 0 else ""))
 
+# =================== PARALLEL BREEDING ==================
+def child_seed(seed, generation, index):
+    """This function derives the seed of a particular child from the seed of the
+    run. It depends only on the generation and the index of the child, so the
+    result does not depend on which process creates the child."""
+    return int(np.random.SeedSequence([seed, generation, index]).generate_state(1)[0])
+
+def breed_children(problem, parents, tasks, generation, crossover_params, mutation_params, cache = None, timings = None):
+    """This function creates and evaluates the childs described by tasks, as
+    (id, parentA index, parentB index, seed) tuples. The same function is used by
+    the serial run and by the worker processes, so both give the same childs.
+    The time spent in crossover, mutation and evaluation is added to timings."""
+    childs = []
+    for id, a, b, seed in tasks:
+        rng = None if seed is None else random.Random(seed)
+        childs.append(Chromosome(id, generation, problem.employers, problem.days, mutation_params = mutation_params, crossover_params = (crossover_params[0], crossover_params[1], parents[a], parents[b]), evaluate = False, problem = problem, rng = rng, timings = timings))
+    start = time.perf_counter()
+    evaluate_chromosomes(childs, problem, cache)
+    if timings is not None: timings["evaluation"] += time.perf_counter() - start
+    return childs
+
+worker_cache = None # fitness cache of a worker process, see init_worker()
+
+def init_worker(cache_size):
+    """This function initializes a worker process, creating its fitness cache."""
+    global worker_cache
+    worker_cache = FitnessCache(cache_size) if cache_size > 0 else None
+
+def breed_chunk(problem, packed_parents, tasks, generation, crossover_params, mutation_params):
+    """This function is executed by the worker processes. It restores the shipped
+    parents, creates a chunk of childs and returns them in a compact form, along
+    with the hits, misses and evictions of the worker cache during the chunk and
+    the time spent in each phase."""
+    counters = [0, 0, 0] if worker_cache is None else [worker_cache.hits, worker_cache.misses, worker_cache.evictions]
+    timings = {"crossover" : 0.0, "mutation" : 0.0, "evaluation" : 0.0}
+    parents = unpack_chromosomes(problem, generation - 1, *packed_parents)
+    childs = breed_children(problem, parents, tasks, generation, crossover_params, mutation_params, worker_cache, timings)
+    if worker_cache is not None:
+        counters = [worker_cache.hits - counters[0], worker_cache.misses - counters[1], worker_cache.evictions - counters[2]]
+    return pack_chromosomes(childs), counters, timings
+
+def pack_chromosomes(chromosomes):
+    """This function packs evaluated chromosomes into a few contiguous arrays
+    (ids, uint8 grids, costs, row costs, feasibility) to be sent between processes."""
+    return (np.array([c.id for c in chromosomes]), np.stack([c.grid for c in chromosomes]),
+            np.array([c.cost for c in chromosomes]), np.stack([c.row_costs for c in chromosomes]),
+            np.array([c.feasible for c in chromosomes]))
+
+def unpack_chromosomes(problem, generation, ids, grids, costs, row_costs, feasible):
+    """This function restores the chromosomes packed by pack_chromosomes()."""
+    return [Chromosome.from_grid(int(ids[i]), generation, grids[i], problem, int(costs[i]), bool(feasible[i]), row_costs[i]) for i in range(len(ids))]
+
+# ====================== OBSERVERS =======================
+class Observer:
+    """This class is the base of the observers of a Population. on_generation()
+    is called with a record (dict) of every new generation: its number, size,
+    lowest, average and highest cost, feasible chromosomes, chromosomes created
+    so far, best cost so far, the improvement over the previous generation (if
+    checked), the cache counters, the total wall time and the wall time of each
+    phase (init, selection, crossover, mutation, evaluation) in seconds.
+    on_finish() is called once, when the population has finished evolving."""
+
+    def on_generation(self, population, record):
+        pass
+
+    def on_finish(self, population):
+        pass
+
+class ConsoleReporter(Observer):
+    """This observer outputs the improvement of every generation and the summary
+    of the run in console."""
+
+    def on_generation(self, population, record):
+        if record["improvement"] is not None:
+            print("GENERATION " + str(record["generation"] - 1) + ": "+ str(record["improvement"]) + " improvement over previous gen.")
+
+    def on_finish(self, population):
+        population.summary()
+
+class PlotReporter(Observer):
+    """This observer shows the graph of the lowest, average and highest cost of
+    every generation at the end of the run."""
+
+    def on_finish(self, population):
+        population.plot()
+
+class JsonlWriter(Observer):
+    """This observer streams the record of every generation as a line of JSON.
+    The sink is either a path (the file is created and closed at the end of the
+    run) or a writable file-like object."""
+
+    def __init__(self, sink):
+        self.owned = isinstance(sink, str)
+        self.file = open(sink, "w") if self.owned else sink
+
+    def on_generation(self, population, record):
+        self.file.write(json.dumps(record) + "\n")
+        self.file.flush()
+
+    def on_finish(self, population):
+        if self.owned:
+            self.file.close()
+
+# ===================== ISLAND MODEL =====================
+class IslandModel:
+    """This class runs several independent populations (islands), each one in
+    its own process. The islands evolve in epochs of migration_interval
+    generations. After every epoch the best migration_size chromosomes of each
+    island migrate to its neighbours, as described by the topology: "ring" (each
+    island sends to the next one) or "full" (each island sends to all others).
+    The coordinator (this class) routes the migrants and collects the stats of
+    every island and the best chromosome found overall."""
+
+    TOPOLOGIES = ("ring", "full")
+
+    def __init__(self, islands, pop_size, crossover_params, mutation_params, min_gen_improvement, migration_size = 2, migration_interval = 5, topology = "ring", problem = None, seed = None, engine = "halving", max_generations = None, elitism = 2):
+        if topology not in self.TOPOLOGIES:
+            raise ValueError("unknown topology " + repr(topology) + ", expected one of " + str(self.TOPOLOGIES))
+        if islands < 1 or migration_interval < 1 or migration_size < 0:
+            raise ValueError("islands and migration_interval must be positive, migration_size must not be negative")
+        self.islands = islands
+        self.pop_size = pop_size
+        self.crossover_params = crossover_params
+        self.mutation_params = mutation_params
+        self.min_gen_improvement = min_gen_improvement
+        self.migration_size = migration_size
+        self.migration_interval = migration_interval
+        self.topology = topology
+        self.problem = WHPP if problem is None else problem
+        self.seed = random.getrandbits(32) if seed is None else seed
+        self.options = {"engine" : engine, "max_generations" : max_generations, "elitism" : elitism} # passed to each Population
+
+        self.stats = [[] for i in range(islands)] # (size, lowest, average, highest) of each generation
+        self.best = None                          # best chromosome found by any island
+        self.best_island = None
+
+    def sources(self, island):
+        """This function returns the islands sending their migrants to an island."""
+        if self.topology == "ring":
+            return [(island - 1) % self.islands] if self.islands > 1 else []
+        return [k for k in range(self.islands) if k != island]
+
+    def run(self):
+        """This function starts the islands, coordinates them until all of them
+        meet their termination conditions and returns the best chromosome found.
+        An island that fails or stops without a reply raises a RuntimeError. The
+        island processes are always stopped, even if one of them fails."""
+
+        connections = []
+        processes = []
+        try:
+            for k in range(self.islands):
+                parent_conn, child_conn = multiprocessing.Pipe()
+                process = multiprocessing.Process(target = island_process, args = (child_conn, self.pop_size, self.crossover_params, self.mutation_params, self.min_gen_improvement, self.problem, child_seed(self.seed, 0, k), self.migration_size, self.options), daemon = True)
+                process.start()
+                child_conn.close()
+                connections.append(parent_conn)
+                processes.append(process)
+
+            active = list(range(self.islands))
+            immigrants = [None] * self.islands
+            while active:
+                # let every active island evolve for one epoch
+                for k in active:
+                    try:
+                        connections[k].send(("epoch", self.migration_interval, immigrants[k]))
+                    except OSError:
+                        raise RuntimeError("island " + str(k) + " stopped without a reply")
+                emigrants = [None] * self.islands
+                finished = []
+                for k in active:
+                    try:
+                        reply = connections[k].recv()
+                    except (EOFError, OSError):
+                        raise RuntimeError("island " + str(k) + " stopped without a reply")
+                    if reply[0] == "error":
+                        raise RuntimeError("island " + str(k) + " failed:\n" + reply[1])
+                    stats, packed_emigrants, packed_best, island_finished = reply[1:]
+                    self.stats[k].extend(stats)
+                    emigrants[k] = [] if packed_emigrants is None else unpack_chromosomes(self.problem, 0, *packed_emigrants)
+                    best = unpack_chromosomes(self.problem, 0, *packed_best)[0]
+                    if self.best is None or best.cost < self.best.cost:
+                        self.best = best
+                        self.best_island = k
+                    if island_finished: finished.append(k)
+                active = [k for k in active if k not in finished]
+
+                # route the migrants of this epoch according to the topology
+                immigrants = [None] * self.islands
+                for k in active:
+                    arriving = []
+                    for source in self.sources(k):
+                        if emigrants[source]: arriving.extend(emigrants[source])
+                    arriving = sorted(arriving, key = lambda c: c.cost)[:self.migration_size]
+                    immigrants[k] = pack_chromosomes(arriving) if arriving else None
+        finally:
+            for conn in connections:
+                try:
+                    conn.send(("stop",))
+                except (BrokenPipeError, OSError):
+                    pass
+            for process in processes:
+                process.join(timeout = 5)
+                if process.is_alive():
+                    process.terminate()
+                    process.join()
+            for conn in connections:
+                conn.close()
+        return self.best
+
+def island_process(conn, pop_size, crossover_params, mutation_params, min_gen_improvement, problem, seed, migration_size, options):
+    """This function runs a single island of an IslandModel in its own process.
+    For every epoch it receives the immigrants and the number of generations to
+    evolve and replies with the stats of the new generations, its emigrants, its
+    best chromosome of the epoch and whether it has met the termination conditions."""
+
+    try:
+        pop = Population(pop_size, crossover_params, mutation_params, min_gen_improvement, problem = problem, seed = seed, run = False, report = False, **options)
+        reported = 0
+        while True:
+            command = conn.recv()
+            if command[0] == "stop":
+                break
+            generations, immigrants = command[1:]
+            if immigrants is not None:
+                pop.immigrate(unpack_chromosomes(problem, pop.generation, *immigrants))
+            for i in range(generations):
+                if not pop.step(): break
+            stats = pop.history[reported:]
+            best = pop.best_chromosome
+            reported = len(pop.history)
+            emigrants = pack_chromosomes(pop.emigrants(migration_size)) if migration_size > 0 else None
+            conn.send(("epoch", stats, emigrants, pack_chromosomes([best]), pop.finished))
+    except Exception:
+        conn.send(("error", traceback.format_exc()))
+    finally:
+        conn.close()
+
+# ==================== FITNESS CACHE =====================
+class FitnessCache:
+    """This class memoizes the evaluation of grids. The entries (feasibility,
+    cost and cost of each row) are addressed by a hash of the grid content, so a
+    grid identical to an already evaluated one is not evaluated again. The cache
+    holds at most max_size entries, evicting the least recently used one."""
+
+    def __init__(self, max_size = 4096):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(grid):
+        return hashlib.blake2b(np.ascontiguousarray(grid).tobytes(), digest_size = 16).digest()
+
+    def lookup(self, key):
+        """This function returns the (feasible, cost, row_costs) entry of a key,
+        or None on a miss."""
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def store(self, key, feasible, cost, row_costs):
+        self.entries[key] = (feasible, cost, row_costs)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last = False)
+            self.evictions += 1
+
+# ====================== DIVERSITY =======================
+DUPLICATE_ATTEMPTS = 3 # mutations tried on a duplicate before it gets a new random grid
+
+def generation_diversity(chromosomes, metric = "unique"):
+    """This function measures the diversity of a generation, from 0 (all grids
+    are the same) to 1. The "unique" metric is the ratio of distinct grids. The
+    "hamming" metric is the average Hamming distance between the grids of two
+    different chromosomes, as a ratio of the cells (see hamming_diversity())."""
+    if metric == "hamming":
+        return hamming_diversity(np.stack([c.grid for c in chromosomes]))
+    return len(set([FitnessCache.key(c.grid) for c in chromosomes])) / len(chromosomes)
+
+def hamming_diversity(grids):
+    """This function returns the average Hamming distance between all pairs of
+    the given grids, divided by the number of cells. Instead of comparing the
+    pairs, the shifts of every cell are counted: two grids differ in a cell
+    unless both have the same shift there, so the distance follows from the
+    counts in linear time."""
+    count = grids.shape[0]
+    if count < 2:
+        return 0.0
+    same = 0
+    for shift in range(int(grids.max()) + 1):
+        shifts = (grids == shift).sum(axis = 0, dtype = np.int64)
+        same += (shifts * (shifts - 1)).sum()
+    pairs = count * (count - 1) * grids[0].size
+    return float(1 - same / pairs)
+
+# ===================== CHECKPOINTS ======================
+# A checkpoint file starts with a magic string, the format version and the
+# length of a JSON header. The header holds the configuration and state of the
+# population and the layout (dtype, shape and offset) of the arrays, which
+# follow it as raw little endian data, each one aligned to 64 bytes, so they
+# can be memory mapped.
+CHECKPOINT_MAGIC = b"WHPPCKPT"
+CHECKPOINT_VERSION = 1
+CHECKPOINT_ALIGNMENT = 64
+
+def write_checkpoint(path, header, arrays):
+    """This function writes a header (a JSON serializable dict) and a dict of
+    numpy arrays to a checkpoint file. The file is written next to the path and
+    then renamed, so it is never left half written."""
+    arrays = {name : np.ascontiguousarray(arrays[name]) for name in arrays}
+    layout = {}
+    offset = 0
+    for name in arrays:
+        array = arrays[name].astype(arrays[name].dtype.newbyteorder("<"), copy = False)
+        arrays[name] = array
+        layout[name] = {"dtype" : array.dtype.str, "shape" : list(array.shape), "offset" : offset}
+        offset += -(-array.nbytes // CHECKPOINT_ALIGNMENT) * CHECKPOINT_ALIGNMENT
+    data = json.dumps(dict(header, arrays = layout)).encode()
+
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as f:
+        f.write(CHECKPOINT_MAGIC + struct.pack("<II", CHECKPOINT_VERSION, len(data)) + data)
+        start = -(-f.tell() // CHECKPOINT_ALIGNMENT) * CHECKPOINT_ALIGNMENT
+        for name in arrays:
+            f.write(b"\0" * (start + layout[name]["offset"] - f.tell()))
+            f.write(arrays[name].tobytes())
+    os.replace(temp_path, path)
+
+def read_checkpoint(path):
+    """This function reads a checkpoint file written by write_checkpoint(). It
+    returns the header and a dict of read only arrays memory mapped from the
+    file, so a population can be inspected without loading all of it."""
+    with open(path, "rb") as f:
+        prefix = f.read(len(CHECKPOINT_MAGIC) + 8)
+        if prefix[:len(CHECKPOINT_MAGIC)] != CHECKPOINT_MAGIC:
+            raise ValueError(repr(path) + " is not a checkpoint file")
+        version, length = struct.unpack("<II", prefix[len(CHECKPOINT_MAGIC):])
+        if version != CHECKPOINT_VERSION:
+            raise ValueError("unsupported checkpoint version " + str(version) + ", expected " + str(CHECKPOINT_VERSION))
+        header = json.loads(f.read(length).decode())
+    start = -(-(len(prefix) + length) // CHECKPOINT_ALIGNMENT) * CHECKPOINT_ALIGNMENT
+    arrays = {}
+    for name, array in header.pop("arrays").items():
+        shape = tuple(array["shape"])
+        if np.prod(shape) == 0: # empty arrays can't be mapped
+            arrays[name] = np.zeros(shape, dtype = array["dtype"])
+        else:
+            arrays[name] = np.memmap(path, dtype = array["dtype"], mode = "r", offset = start + array["offset"], shape = shape)
+    return header, arrays
+
+# ================ SOFT CONSTRAINT RULES =================
+# The soft constraints of the WHPP as a table. Each rule has a type, its
+# parameters and the penalty cost of each violation. Shifts are given as the
+# list of shift types a rule applies to ([1, 2, 3] meaning any work).
+WHPP_RULES = [
+    {"rule" : "max_hours", "hours" : 70, "cost" : 1000},                                       # 1. max 70 hours of work
+    {"rule" : "max_consecutive", "shifts" : [1, 2, 3], "days" : 7, "cost" : 1000},            # 2. max 7 consecutive days of work
+    {"rule" : "max_consecutive", "shifts" : [3], "days" : 4, "cost" : 1000},                   # 3. max 4 consecutive night shifts
+    {"rule" : "avoid_sequence", "shifts" : [3, 1], "cost" : 1000},                             # 4. avoid night shift followed by morning shift
+    {"rule" : "avoid_sequence", "shifts" : [2, 1], "cost" : 800},                              # 5. avoid afternoon shift followed by morning shift
+    {"rule" : "avoid_sequence", "shifts" : [3, 2], "cost" : 800},                              # 6. avoid night shift followed by afternoon shift
+    {"rule" : "rest_after", "shifts" : [3], "days" : 4, "days_off" : 2, "cost" : 100},         # 7. at least 2 days off after 4 night shifts
+    {"rule" : "rest_after", "shifts" : [1, 2, 3], "days" : 7, "days_off" : 2, "cost" : 100},  # 8. at least 2 days off after 7 days of work
+    {"rule" : "avoid_pattern", "working" : [True, False, True], "cost" : 1},                   # 9. avoid work - day off - work
+    {"rule" : "avoid_pattern", "working" : [False, True, False], "cost" : 1},                  # 10. avoid day off - work - day off
+    {"rule" : "max_weekends", "weekends" : 1, "cost" : 1},                                     # 11. max 1 weekend of work
+]
+
+RULE_PARAMS = {"max_hours" : ("hours",), "max_consecutive" : ("shifts", "days"), "avoid_sequence" : ("shifts",),
+               "rest_after" : ("shifts", "days", "days_off"), "avoid_pattern" : ("working",), "max_weekends" : ("weekends",)}
+
+def load_rules(path):
+    """This function loads a rule table (a JSON list in the format of WHPP_RULES),
+    so the rules and their costs can be changed without editing the code."""
+    with open(path) as f:
+        rules = json.load(f)
+    check_rules(rules)
+    return rules
+
+def check_rules(rules):
+    """This function checks that every rule of a table has a known type and all
+    of its parameters."""
+    for rule in rules:
+        if rule.get("rule") not in RULE_PARAMS:
+            raise ValueError("unknown rule type " + repr(rule.get("rule")) + ", expected one of " + str(list(RULE_PARAMS)))
+        for param in RULE_PARAMS[rule["rule"]] + ("cost",):
+            if param not in rule:
+                raise ValueError("rule " + repr(rule["rule"]) + " is missing parameter " + repr(param))
+
+compiled_scanners = {} # compile_rules() results, by rule table and shift hours
+
+def compile_rules(rules, shift_hours):
+    """This function compiles a rule table into one fused scanner: a function
+    that returns the penalty cost of a row (list of shifts of an employer). Every
+    rule is turned into a small state machine and all of them are updated in a
+    single pass over the days. The source of the scanner is generated and
+    compiled once per rule table. The rules behave exactly like the original
+    checks of the WHPP, e.g. a maximum consecutive days counter is reset by a
+    penalty and skips the day it is found on."""
+
+    key = json.dumps([rules, sorted(shift_hours.items())], sort_keys = True)
+    if key in compiled_scanners:
+        return compiled_scanners[key]
+    check_rules(rules)
+    shifts_range = range(max(shift_hours) + 1)
+
+    def condition(shifts): # source of a test of the current cell for a list of shifts
+        shifts = sorted(set(shifts))
+        if shifts == list(shifts_range[1:]):
+            return "cell"
+        if len(shifts) == 1:
+            return "cell == " + str(shifts[0])
+        return "cell in " + str(tuple(shifts))
+
+    constants = {}
+    init = ["total = 0"]
+    body = []
+    final = []
+
+    # the shift of the previous day (prev) is shared by the rules. The sequences
+    # to avoid are looked up in one table, prev starts at its last, empty row.
+    sequences = [[0] * len(shifts_range) for shift in range(len(shifts_range) + 1)]
+    init.append("prev = " + str(len(shifts_range)))
+    for rule in rules:
+        if rule["rule"] == "avoid_sequence":
+            sequences[rule["shifts"][0]][rule["shifts"][1]] += rule["cost"]
+    if any([any(row) for row in sequences]):
+        constants["SEQUENCES"] = tuple([tuple(row) for row in sequences])
+        body.append("total += SEQUENCES[prev][cell]")
+
+    # the day off patterns are combined into one automaton, its transitions and
+    # costs are looked up in tables indexed by [state][shift]
+    patterns = [rule for rule in rules if rule["rule"] == "avoid_pattern"]
+    if patterns:
+        states = list(itertools.product(range(3), repeat = len(patterns)))
+        transitions = []
+        costs = []
+        for state in states:
+            transitions.append([])
+            costs.append([])
+            for shift in shifts_range:
+                next_state = []
+                cost = 0
+                for m in range(len(patterns)):
+                    working = patterns[m]["working"]
+                    if state[m] == 0:
+                        next_state.append(1 if (shift != 0) == working[0] else 0)
+                    elif state[m] == 1:
+                        next_state.append(2 if (shift != 0) == working[1] else 0)
+                    else:
+                        cost += patterns[m]["cost"] if (shift != 0) == working[2] else 0
+                        next_state.append(0)
+                transitions[-1].append(states.index(tuple(next_state)))
+                costs[-1].append(cost)
+        constants["PATTERN_COSTS"] = tuple([tuple(row) for row in costs])
+        constants["PATTERN_TRANSITIONS"] = tuple([tuple(row) for row in transitions])
+        init.append("pattern = 0")
+        body.append("total += PATTERN_COSTS[pattern][cell]")
+        body.append("pattern = PATTERN_TRANSITIONS[pattern][cell]")
+
+    for k in range(len(rules)):
+        rule = rules[k]
+        kind = rule["rule"]
+        cost = str(rule["cost"])
+        if kind == "max_hours":
+            if "hours = 0" not in init:
+                hours = [0] * len(shifts_range)
+                for shift in shift_hours:
+                    hours[shift] = shift_hours[shift]
+                constants["HOURS"] = tuple(hours)
+                init.append("hours = 0")
+                body.append("hours += HOURS[cell]")
+            final.append("if hours > " + str(rule["hours"]) + ": total += " + cost)
+        elif kind == "max_consecutive":
+            init.append("count%d = 0" % k)
+            body.append("if count%d > %d:" % (k, rule["days"]))
+            body.append("    total += " + cost)
+            body.append("    count%d = 0" % k)
+            body.append("else:")
+            body.append("    count%d = count%d + 1 if %s else 0" % (k, k, condition(rule["shifts"])))
+        elif kind == "rest_after":
+            # run%d_i is the length of the run of shifts ending i + 1 days ago and
+            # work%d_i tells if the day i + 2 days ago was a working day (for the
+            # previous day prev is used). The window of a run is complete on its
+            # last day off, where it is checked.
+            days_off = rule["days_off"]
+            init.extend(["run%d_%d = 0" % (k, i) for i in range(days_off)])
+            init.extend(["work%d_%d = False" % (k, i) for i in range(days_off - 2)])
+            working = ["cell", "prev"][:days_off] + ["work%d_%d" % (k, i) for i in range(days_off - 2)]
+            body.append("if run%d_%d >= %d and (%s): total += %s" % (k, days_off - 1, rule["days"], " or ".join(working), cost))
+            runs = ["run%d_%d" % (k, i) for i in range(days_off)]
+            body.append("%s = %s" % (", ".join(runs), ", ".join(["(run%d_0 + 1 if %s else 0)" % (k, condition(rule["shifts"]))] + runs[:-1])))
+            if days_off > 2:
+                works = ["work%d_%d" % (k, i) for i in range(days_off - 2)]
+                body.append("%s = %s" % (", ".join(works), ", ".join(["prev != 0"] + works[:-1])))
+        elif kind == "max_weekends":
+            if "weekends = 0" not in init:
+                init.append("weekends = 0")
+                body.append("if day == 6 and cell and prev: weekends += 1")
+            final.append("if weekends > %d: total += %s * (weekends - %d)" % (rule["weekends"], cost, rule["weekends"]))
+    body.append("prev = cell")
+
+    source = "def scan(row):\n"
+    source += "".join(["    " + line + "\n" for line in init])
+    if "weekends = 0" in init: # the day of the week is only needed for the weekends
+        source += "    for cell, day in zip(row, cycle(WEEK)):\n"
+    else:
+        source += "    for cell in row:\n"
+    source += "".join(["        " + line + "\n" for line in body])
+    source += "".join(["    " + line + "\n" for line in final])
+    source += "    return total\n"
+
+    namespace = dict(constants, cycle = itertools.cycle, WEEK = tuple(range(7)))
+    exec(compile(source, "<soft constraint scanner>", "exec"), namespace)
+    compiled_scanners[key] = namespace["scan"]
+    return namespace["scan"]
+
+class Problem:
+    """This class holds the constants of a WHPP instance: its size, the hard
+    constraint (employers per shift type for each day of the week), the
+    duration of each shift type and the table of soft constraint rules. A single
+    instance is shared by all chromosomes. The backend selects how the rules
+    are evaluated: "numpy" (soft_constraint_rows()), "scanner" (compile_rules())
+    or "bitboard" (bitboard_rows(), for large rosters). All of them give the
+    same costs."""
+
+    __slots__ = ("employers", "days", "hard_constraint", "max_shifts", "shift_hours", "rules", "backend")
+
+    BACKENDS = ("numpy", "scanner", "bitboard")
+
+    def __init__(self, employers = 30, days = 14, hard_constraint = None, shift_hours = None, rules = None, backend = "numpy"):
+        if backend not in self.BACKENDS:
+            raise ValueError("unknown backend " + repr(backend) + ", expected one of " + str(self.BACKENDS))
+        self.employers = employers
+        self.days = days
+        self.hard_constraint = [[10, 10, 5, 5, 5, 5, 5], [10, 10, 10, 5, 10, 5, 5], [5, 5, 5, 5, 5, 5, 5]] if hard_constraint is None else hard_constraint
+
+        # declare duration of hours for each shift
+        self.shift_hours = {1 : 8, 2 : 8, 3 : 10} if shift_hours is None else shift_hours
+        self.max_shifts = len(self.shift_hours)
+
+        # soft constraints (see WHPP_RULES)
+        self.rules = WHPP_RULES if rules is None else rules
+        check_rules(self.rules)
+        self.backend = backend
+
+    def scanner(self):
+        """This function returns the compiled soft constraint scanner of the rules."""
+        return compile_rules(self.rules, self.shift_hours)
+
+    def evaluate_rows(self, rows):
+        """This function returns the penalty cost of every employer (row) of the
+        given (rows x days) array, using the evaluation backend of the problem."""
+        if self.backend == "scanner":
+            scan = self.scanner()
+            return np.array([scan(row) for row in np.asarray(rows).tolist()], dtype = np.int64)
+        if self.backend == "bitboard":
+            return bitboard_rows(rows, self.shift_hours, self.rules)
+        return soft_constraint_rows(rows, self.shift_hours, self.rules)
+
+    @classmethod
+    def scaled(cls, employers, days, rules = None, backend = "numpy"):
+        """This function creates a problem of a different size. The hard constraint
+        of the WHPP is scaled proportionally to the number of employers."""
+        base = cls()
+        hard_constraint = [[shifts * employers // base.employers for shifts in row] for row in base.hard_constraint]
+        return cls(employers, days, hard_constraint, rules = rules, backend = backend)
+
+WHPP = Problem() # the default problem instance (30 employers, 14 days)
+
+# =================== BATCH EVALUATION ===================
+def evaluate_generation(grids, hard_constraint, shift_hours, rules = None):
+    """This function evaluates a whole generation at once. The grids are given as
+    one (chromosomes x employers x days) integer array. It returns a boolean array
+    with the feasibility of each chromosome and an integer array with its penalty
+    cost. The results are identical to check_hard_constraint() and
+    check_soft_constraints() of the Chromosome class."""
+
+    grids = np.asarray(grids)
+    feasible = check_hard_constraints(grids, hard_constraint)
+    costs = soft_constraint_rows(grids, shift_hours, rules).sum(axis = -1)
+    return feasible, costs
+
+def check_hard_constraints(grids, hard_constraint):
+    """This function checks the feasibility of a generation of grids. For every
+    shift type the employers of each day are counted and compared with the hard
+    constraint of that day of the week (weeks are repeating)."""
+
+    days = grids.shape[-1]
+    feasible = np.ones(grids.shape[0], dtype = bool)
+    for m in range(len(hard_constraint)):
+        required = np.resize(np.asarray(hard_constraint[m]), days)
+        assigned = (grids == m + 1).sum(axis = -2)
+        feasible &= (assigned == required).all(axis = -1)
+    return feasible
+
+def evaluate_chromosomes(chromosomes, problem, cache = None):
+    """This function scores a whole generation at once. The grids of the given
+    chromosomes are stacked into a (chromosomes x employers x days) array to check
+    their feasibility. Only the employer rows without an up to date cached cost
+    (see Chromosome.stale_rows()) are collected and evaluated in one call of
+    soft_constraint_rows(). The resulting feasibility and cost of each chromosome
+    are stored back. With a FitnessCache, only grids not found in it (and not
+    repeated earlier in the generation) are evaluated."""
+
+    if cache is not None:
+        keys = {}
+        pending = []
+        duplicates = []
+        for c in chromosomes:
+            key = cache.key(c.grid)
+            if key in keys: # same grid earlier in this generation
+                cache.hits += 1
+                duplicates.append((c, keys[key]))
+                continue
+            entry = cache.lookup(key)
+            if entry is None:
+                keys[key] = c
+                pending.append(c)
+            else:
+                c.feasible, c.cost, c.row_costs = entry
+                c.dirty_rows = None
+        if pending:
+            evaluate_chromosomes(pending, problem)
+        for key in keys:
+            cache.store(key, keys[key].feasible, keys[key].cost, keys[key].row_costs)
+        for c, original in duplicates:
+            c.feasible, c.cost, c.row_costs = original.feasible, original.cost, original.row_costs
+            c.dirty_rows = None
+        return
+
+    grids = np.stack([c.grid for c in chromosomes])
+    feasible = check_hard_constraints(grids, problem.hard_constraint)
+    stale_rows = [c.stale_rows() for c in chromosomes]
+    rows = np.concatenate([chromosomes[i].grid[stale_rows[i]] for i in range(len(chromosomes))])
+    row_costs = problem.evaluate_rows(rows)
+    offset = 0
+    for i in range(len(chromosomes)):
+        chromosomes[i].feasible = bool(feasible[i])
+        chromosomes[i].apply_row_costs(stale_rows[i], row_costs[offset:offset + len(stale_rows[i])])
+        offset += len(stale_rows[i])
+
+def soft_constraint_rows(grids, shift_hours, rules = None):
+    """This function evaluates the soft constraints (the WHPP_RULES by default)
+    for every employer (row) of the given grids at once. Every rule operates on
+    the whole array, only the rules depending on a running counter iterate
+    through the days. The penalty cost of each row is returned, so the cost of a
+    chromosome is the sum of its rows. The costs are identical to the ones of
+    the scanner compiled by compile_rules()."""
+
+    grids = np.asarray(grids)
+    rules = WHPP_RULES if rules is None else rules
+    work = grids != 0
+    total_cost = np.zeros(grids.shape[:-1], dtype = np.int64)
+
+    for rule in rules:
+        kind = rule["rule"]
+        if kind == "max_hours":
+            hours = np.zeros(max(shift_hours) + 1, dtype = np.int64)
+            for shift in shift_hours:
+                hours[shift] = shift_hours[shift]
+            total_cost += rule["cost"] * (hours[grids].sum(axis = -1) > rule["hours"])
+        elif kind == "max_consecutive":
+            total_cost += rule["cost"] * _consecutive_penalties(np.isin(grids, rule["shifts"]), rule["days"])
+        elif kind == "avoid_sequence":
+            first, second = rule["shifts"]
+            total_cost += rule["cost"] * ((grids[..., :-1] == first) & (grids[..., 1:] == second)).sum(axis = -1)
+        elif kind == "rest_after":
+            total_cost += rule["cost"] * _rest_violations(np.isin(grids, rule["shifts"]), work, rule["days"], rule["days_off"])
+        elif kind == "avoid_pattern":
+            total_cost += rule["cost"] * _pattern_matches(work, rule["working"])
+        elif kind == "max_weekends":
+            sundays = work[..., 6::7]
+            saturdays = work[..., 5::7][..., :sundays.shape[-1]]
+            weekends_worked = (saturdays & sundays).sum(axis = -1)
+            total_cost += rule["cost"] * np.maximum(weekends_worked - rule["weekends"], 0)
+        else:
+            raise ValueError("unknown rule type " + repr(kind))
+
+    return total_cost
+
+def _consecutive_penalties(mask, consecutive_days):
+    """Counts the penalties of a maximum consecutive days check. Like the original
+    counter, a penalty resets the count and the day it is found on is skipped."""
+    count = np.zeros(mask.shape[:-1], dtype = np.int64)
+    penalties = np.zeros(mask.shape[:-1], dtype = np.int64)
+    for j in range(mask.shape[-1]):
+        exceeded = count > consecutive_days
+        penalties += exceeded
+        count = np.where(exceeded | ~mask[..., j], 0, count + 1)
+    return penalties
+
+def _rest_violations(mask, work, consecutive_days, days_off):
+    """Counts the windows of consecutive_days masked days (e.g. night shifts) that
+    are not followed by days_off days off."""
+    windows = mask.shape[-1] - (consecutive_days + days_off - 1)
+    if windows <= 0:
+        return np.zeros(mask.shape[:-1], dtype = np.int64)
+    full = np.ones(mask.shape[:-1] + (windows,), dtype = bool)
+    for k in range(consecutive_days):
+        full &= mask[..., k:k + windows]
+    working = np.zeros_like(full)
+    for k in range(days_off):
+        working |= work[..., consecutive_days + k:consecutive_days + k + windows]
+    return (full & working).sum(axis = -1)
+
+def _pattern_matches(work, pattern):
+    """Counts the matches of a three day work/day off pattern, following the
+    three-state check of the original implementation (a matched or broken
+    pattern always restarts from the next day)."""
+    check = np.zeros(work.shape[:-1], dtype = np.int64)
+    matches = np.zeros(work.shape[:-1], dtype = np.int64)
+    for j in range(work.shape[-1]):
+        cell = work[..., j]
+        matches += (check == 2) & (cell == pattern[2])
+        check = np.where(check == 0, cell == pattern[0], np.where(check == 1, 2 * (cell == pattern[1]), 0))
+    return matches
+
+# =================== BATCH OPERATORS ====================
+def generate_grids(count, problem, generator):
+    """This function generates the grids of a whole generation at once, as one
+    (count x employers x days) array. Every day (column) of every grid is a random
+    permutation of the shifts required by the hard constraint on that day of the
+    week (zeros filling the rest of the employers), drawn from the given numpy
+    generator. Like generateGridAlternative(), the feasibility of the grids is
+    guaranteed 100%, without any rejected picks."""
+
+    columns = np.zeros((7, problem.employers), dtype = np.uint8)
+    for day_of_week in range(7):
+        required = [problem.hard_constraint[m][day_of_week] for m in range(len(problem.hard_constraint))]
+        if sum(required) > problem.employers:
+            raise ValueError("the hard constraint needs " + str(sum(required)) + " employers on day " + str(day_of_week) + ", there are " + str(problem.employers))
+        columns[day_of_week, :sum(required)] = np.repeat(np.arange(1, len(required) + 1), required)
+
+    days = np.resize(columns, (problem.days, problem.employers)) # repeating weeks
+    grids = generator.permuted(np.broadcast_to(days, (count,) + days.shape), axis = -1)
+    return np.ascontiguousarray(grids.transpose(0, 2, 1))
+
+def breed_generation(problem, parents, pairs, first_id, generation, crossover_params, mutation_params, generator, cache = None, timings = None):
+    """This function creates and evaluates the childs of a whole generation at
+    once, one for each pair of parent indexes. The grids of the parents are
+    stacked, crossover_grids() and mutate_grids() create all child grids in one
+    (childs x employers x days) array and the childs get the ids from first_id
+    on. The cached cost of every row equal to the same row of a parent is reused,
+    so only the rest of the rows are evaluated. The time spent in each phase is
+    added to timings."""
+
+    start = time.perf_counter()
+    pairs = np.asarray(pairs, dtype = np.int64).reshape(-1, 2)
+    grids = np.stack([c.grid for c in parents])
+    costs = np.array([c.cost for c in parents])
+    gridsA, gridsB = grids[pairs[:, 0]], grids[pairs[:, 1]]
+    childs_grids = crossover_grids(gridsA, gridsB, costs[pairs[:, 0]], costs[pairs[:, 1]], crossover_params, generator)
+    middle = time.perf_counter()
+    mutate_grids(childs_grids, mutation_params, generator)
+    if timings is not None:
+        timings["crossover"] += middle - start
+        timings["mutation"] += time.perf_counter() - middle
+
+    # reuse the cached cost of rows equal to a parent's row
+    same_as_A = (childs_grids == gridsA).all(axis = -1)
+    same_as_B = (childs_grids == gridsB).all(axis = -1)
+    row_costs = np.stack([c.row_costs for c in parents])
+    row_costs = np.where(same_as_A, row_costs[pairs[:, 0]], row_costs[pairs[:, 1]])
+    childs = []
+    for i in range(len(pairs)):
+        c = Chromosome.from_grid(first_id + i, generation, childs_grids[i], problem, int(row_costs[i].sum()), row_costs = row_costs[i])
+        c.mark_dirty(~(same_as_A[i] | same_as_B[i]))
+        childs.append(c)
+
+    start = time.perf_counter()
+    evaluate_chromosomes(childs, problem, cache)
+    if timings is not None: timings["evaluation"] += time.perf_counter() - start
+    return childs
+
+def crossover_grids(gridsA, gridsB, costsA, costsB, crossover_params, generator):
+    """This function is the batched version of Chromosome.crossover(). It returns
+    the grids of the childs of the given parent grids (one child per pair), each
+    column copied from parent A or B according to a per-child column mask. The
+    mask follows the probabilities of the original method: crossover happens
+    with the given propability, at one random index (first method) or at every
+    index with a 25% chance (second method), starting from a random parent. A
+    crossover index switches to parent B, or back to A when the active parent
+    has the cost of B (so parents with equal costs stay on A). Without crossover
+    the child copies a random parent."""
+
+    propability = crossover_params[0]
+    first_method = crossover_params[1]
+    childs, days = gridsA.shape[0], gridsA.shape[-1]
+
+    crossed = generator.random(childs) < propability
+    start_on_B = generator.integers(0, 2, childs) == 1
+    if first_method: # method 1 (simpler - max one toggle index)
+        indexes = np.zeros((childs, days), dtype = bool)
+        indexes[np.arange(childs), generator.integers(1, max(days, 2), childs) % days] = days > 1
+    else: # method 2 (complex - multiple random crossover points)
+        indexes = generator.random((childs, days)) < 0.25
+    switches = np.cumsum(indexes, axis = -1)
+    equal_costs = (np.asarray(costsA) == np.asarray(costsB))[:, None]
+    from_B = np.where(equal_costs, start_on_B[:, None] & (switches == 0), start_on_B[:, None] ^ (switches % 2 == 1))
+    from_B = np.where(crossed[:, None], from_B, start_on_B[:, None])
+    return np.where(from_B[:, None, :], gridsB, gridsA)
+
+def mutate_grids(grids, mutation_params, generator):
+    """This function is the batched version of Chromosome.mutate(), changing the
+    given (childs x employers x days) grids in place. Each grid is mutated with
+    the given propability. The first method swaps the shifts of random pairs of
+    employers, 0 to employers // 15 times in each day. All grids and days are
+    handled together, one swap at a time. The second method reverses the order
+    of the shifts of a day with a 80% chance."""
+
+    propability = mutation_params[0]
+    first_method = mutation_params[1]
+    childs, employers, days = grids.shape
+
+    mutated = generator.random(childs) < propability
+    if first_method == 1: # method 1, random vertical swaps
+        swaps = generator.integers(0, employers // 15 + 1, (childs, days)) * mutated[:, None]
+        for k in range(swaps.max(initial = 0)):
+            child, day = np.nonzero(swaps > k)
+            swap_index_1 = generator.integers(0, employers, len(child))
+            swap_index_2 = generator.integers(0, employers, len(child))
+            shifts_1 = grids[child, swap_index_1, day]
+            grids[child, swap_index_1, day] = grids[child, swap_index_2, day]
+            grids[child, swap_index_2, day] = shifts_1
+    else: # method 2, inversion of order of shifts in a day
+        reversed_days = mutated[:, None] & (generator.integers(0, 5, (childs, days)) != 0)
+        grids[...] = np.where(reversed_days[:, None, :], grids[:, ::-1, :], grids)
+
+# ================= BITBOARD EVALUATION ==================
+# Every employer (row) is stored as bitmasks, one for each group of shift types
+# the rules need, where bit j is set if the employer has one of those shifts on
+# day j. The bits of a row are kept in 64 bit words, so the masks of all rows
+# are one (rows x words) array. The rules are checked for whole rows at once
+# with shifts, ANDs and popcounts. The two rules depending on a running counter
+# run their state machine over 8 days at a time, using transition tables.
+POPCOUNT = np.array([bin(byte).count("1") for byte in range(256)], dtype = np.int64)
+
+def to_bitboards(grids, shifts):
+    """This function returns the bitmasks of the days on which every row of the
+    given grids has one of the given shift types, as a (rows x words) array."""
+    grids = np.asarray(grids)
+    packed = np.packbits(np.isin(grids.reshape(-1, grids.shape[-1]), shifts), axis = -1, bitorder = "little")
+    words = -(-packed.shape[-1] // 8)
+    boards = np.zeros((packed.shape[0], words * 8), dtype = np.uint8)
+    boards[:, :packed.shape[-1]] = packed
+    return boards.view("<u8")
+
+def day_bitboard(days, words):
+    """This function returns a bitmask (as a 1 x words array) of the given days."""
+    boards = np.zeros((1, words * 64), dtype = bool)
+    boards[0, list(days)] = True
+    return np.packbits(boards, axis = -1, bitorder = "little").view("<u8")
+
+def bitboard_rows(grids, shift_hours, rules = None):
+    """This function evaluates the soft constraints (the WHPP_RULES by default)
+    for every employer (row) of the given grids on their bitmasks, like
+    soft_constraint_rows(). The penalty cost of each row is returned."""
+
+    grids = np.asarray(grids)
+    rules = WHPP_RULES if rules is None else rules
+    days = grids.shape[-1]
+    masks = {} # bitmasks of the rows, by shift types
+    def bitboards(shifts):
+        key = tuple(sorted(set(shifts)))
+        if key not in masks:
+            masks[key] = to_bitboards(grids, key)
+        return masks[key]
+    work = bitboards(range(1, max(shift_hours) + 1))
+    words = work.shape[-1]
+    total_cost = np.zeros(work.shape[0], dtype = np.int64)
+
+    for rule in rules:
+        kind = rule["rule"]
+        if kind == "max_hours":
+            hours = sum([shift_hours[shift] * _popcount(bitboards([shift])) for shift in shift_hours])
+            total_cost += rule["cost"] * (hours > rule["hours"])
+        elif kind == "max_consecutive":
+            total_cost += rule["cost"] * _run_automaton(bitboards(rule["shifts"]), days, ("max_consecutive", rule["days"]))
+        elif kind == "avoid_sequence":
+            first, second = rule["shifts"]
+            total_cost += rule["cost"] * _popcount(bitboards([first]) & _shift_days(bitboards([second]), 1))
+        elif kind == "rest_after":
+            windows = days - (rule["days"] + rule["days_off"] - 1)
+            if windows <= 0:
+                continue
+            mask = bitboards(rule["shifts"])
+            full = day_bitboard(range(windows), words) # windows of consecutive days starting on each bit
+            for k in range(rule["days"]):
+                full = full & _shift_days(mask, k)
+            working = np.zeros_like(work)
+            for k in range(rule["days_off"]):
+                working |= _shift_days(work, rule["days"] + k)
+            total_cost += rule["cost"] * _popcount(full & working)
+        elif kind == "avoid_pattern":
+            total_cost += rule["cost"] * _run_automaton(work, days, ("avoid_pattern", tuple(rule["working"])))
+        elif kind == "max_weekends":
+            saturdays = day_bitboard(range(5, days - 1, 7), words)
+            weekends_worked = _popcount(work & _shift_days(work, 1) & saturdays)
+            total_cost += rule["cost"] * np.maximum(weekends_worked - rule["weekends"], 0)
+        else:
+            raise ValueError("unknown rule type " + repr(kind))
+
+    return total_cost.reshape(grids.shape[:-1])
+
+def _popcount(boards):
+    """Counts the set bits of every row of bitmasks."""
+    return POPCOUNT[boards.view(np.uint8)].sum(axis = -1)
+
+def _shift_days(boards, k):
+    """Shifts rows of bitmasks by k days, so bit j of the result is bit j + k."""
+    words, bits = divmod(k, 64)
+    shifted = np.zeros_like(boards)
+    shifted[:, :boards.shape[-1] - words] = boards[:, words:]
+    if bits:
+        carry = np.zeros_like(shifted)
+        carry[:, :-1] = shifted[:, 1:] << np.uint64(64 - bits)
+        shifted = (shifted >> np.uint64(bits)) | carry
+    return shifted
+
+automaton_tables = {} # _automaton_tables() results, by state machine and days per byte
+
+def _automaton_tables(machine, bits):
+    """Builds the transition and cost tables of a state machine of the rules for
+    bytes of the given number of days. Both are indexed by state * 256 + byte."""
+    key = (machine, bits)
+    if key not in automaton_tables:
+        kind, param = machine
+        if kind == "max_consecutive": # the state is the counter, reset by a penalty skipping its day
+            states = param + 2
+            def step(count, bit):
+                if count > param:
+                    return 0, 1
+                return (count + 1 if bit else 0), 0
+        else: # the state is the number of days of the pattern found
+            states = 3
+            def step(check, bit):
+                if check == 2:
+                    return 0, int(bit == param[2])
+                return (check + 1 if bit == param[check] else 0), 0
+        transitions = np.zeros(states * 256, dtype = np.int64)
+        costs = np.zeros(states * 256, dtype = np.int64)
+        for state in range(states):
+            for byte in range(256):
+                current, cost = state, 0
+                for j in range(bits):
+                    current, penalty = step(current, bool(byte >> j & 1))
+                    cost += penalty
+                transitions[state * 256 + byte] = current
+                costs[state * 256 + byte] = cost
+        automaton_tables[key] = (transitions, costs)
+    return automaton_tables[key]
+
+def _run_automaton(boards, days, machine):
+    """Runs a state machine of the rules (see _automaton_tables()) through the
+    days of all rows of bitmasks at once, one byte (8 days) at a time. The total
+    cost of each row is returned."""
+    data = boards.view(np.uint8)
+    state = np.zeros(data.shape[0], dtype = np.int64)
+    total = np.zeros(data.shape[0], dtype = np.int64)
+    for k in range(-(-days // 8)):
+        transitions, costs = _automaton_tables(machine, min(8, days - 8 * k))
+        index = state * 256 + data[:, k]
+        total += costs[index]
+        state = transitions[index]
+    return total
+
 # ========================= MAIN =========================
-# setting up variables (editable) ------------------------
-max_gens = 10           # max generations (term_cond_1)
-min_improvement = 0     # enforce minimum gen-over-gen percentage (term_cond_2)
+if __name__ == "__main__":
+    # setting up variables (editable, or swept by sweep.py) ---------
+    max_gens = 10           # max generations (term_cond_1)
+    min_improvement = 0     # enforce minimum gen-over-gen percentage (term_cond_2)
 
-p_cross = 0.8                   # propability of applying crossover (recommended > 0.5)
-cross_method_1_selected = True  # switch between two crossover methods
+    p_cross = 0.8                   # propability of applying crossover (recommended > 0.5)
+    cross_method_1_selected = True  # switch between two crossover methods
 
-p_mut = 0.5                     # propability of applying mutation (recommended > 0.3)
-mut_method_1_selected = True    # switch between two mutation methods
+    p_mut = 0.5                     # propability of applying mutation (recommended > 0.3)
+    mut_method_1_selected = True    # switch between two mutation methods
 
-# beginning procedure (do not edit) ----------------------
-pop = Population(2 ** (max_gens - 1), crossover_params = (p_cross , cross_method_1_selected), mutation_params = (p_mut, mut_method_1_selected), min_gen_improvement = min_improvement, verbose = False)
\ No newline at end of file
+    # beginning procedure (do not edit) ----------------------
+    pop = Population(2 ** (max_gens - 1), crossover_params = (p_cross , cross_method_1_selected), mutation_params = (p_mut, mut_method_1_selected), min_gen_improvement = min_improvement, verbose = False, plot = True)
\ No newline at end of file
@@ -0,0 +1,135 @@
+"""Parameter sweep of the genetic algorithm. Every combination of the given
+parameter values and seeds is an independent headless run of the Population,
+with the settings of main.py (a population of 2 ** (max_gens - 1) chromosomes).
+The runs are spread over a pool of processes and their results are stored in a
+local SQLite database: one row per run with its final results and one row per
+generation of each run. A run is stored in a single transaction once it has
+finished, so when a sweep is restarted the finished configurations are skipped:
+
+    python sweep.py --p-cross 0.6 0.8 --p-mut 0.3 0.5 --seeds 1 2 3 --db sweep.db
+"""
+
+import argparse
+import itertools
+import json
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from main import Population
+
+# the swept parameters, in the order of the columns of the runs table
+PARAMETERS = ("p_cross", "cross_method_1", "p_mut", "mut_method_1", "max_gens", "min_improvement", "seed")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    config TEXT PRIMARY KEY,
+    p_cross REAL, cross_method_1 INTEGER, p_mut REAL, mut_method_1 INTEGER,
+    max_gens INTEGER, min_improvement REAL, seed INTEGER,
+    generations INTEGER, best_cost INTEGER, best_feasible INTEGER, wall REAL, finished REAL
+);
+CREATE TABLE IF NOT EXISTS generations (
+    config TEXT, generation INTEGER, size INTEGER, lowest INTEGER, average INTEGER, highest INTEGER, diversity REAL,
+    PRIMARY KEY (config, generation)
+);
+"""
+
+def configurations(grid):
+    """This function returns every combination of the values of a parameter
+    grid (a dict of lists, by parameter) as a list of dicts."""
+    values = [grid[name] for name in PARAMETERS]
+    return [dict(zip(PARAMETERS, combination)) for combination in itertools.product(*values)]
+
+def config_key(config):
+    """This function returns the key of a configuration in the database."""
+    return json.dumps(config, sort_keys = True)
+
+def open_database(path):
+    """This function opens (or creates) the results database."""
+    db = sqlite3.connect(path)
+    db.executescript(SCHEMA)
+    return db
+
+def finished_keys(db):
+    """This function returns the keys of the configurations already stored."""
+    return set([row[0] for row in db.execute("SELECT config FROM runs")])
+
+def run_config(config):
+    """This function is executed by the worker processes. It runs one
+    configuration without any output and returns its results: the stats and
+    diversity of every generation and the best chromosome found."""
+    start = time.perf_counter()
+    pop = Population(2 ** (config["max_gens"] - 1), crossover_params = (config["p_cross"], config["cross_method_1"]),
+                     mutation_params = (config["p_mut"], config["mut_method_1"]), min_gen_improvement = config["min_improvement"],
+                     seed = config["seed"], report = False)
+    best = pop.best_chromosome
+    return {"history" : pop.history, "diversity" : pop.diversity_history, "best_cost" : best.cost,
+            "best_feasible" : best.feasible, "wall" : time.perf_counter() - start}
+
+def store(db, config, result):
+    """This function stores the results of a run, all of them in one transaction."""
+    key = config_key(config)
+    with db:
+        db.executemany("INSERT OR REPLACE INTO generations VALUES (?, ?, ?, ?, ?, ?, ?)",
+                       [(key, i) + tuple(result["history"][i]) + (result["diversity"][i],) for i in range(len(result["history"]))])
+        db.execute("INSERT OR REPLACE INTO runs VALUES (" + ", ".join(["?"] * (len(PARAMETERS) + 6)) + ")",
+                   (key,) + tuple(config[name] for name in PARAMETERS) +
+                   (len(result["history"]), result["best_cost"], result["best_feasible"], result["wall"], time.time()))
+
+def sweep(grid, db_path, workers = None):
+    """This function runs every configuration of the grid that is not already
+    stored in the database on a pool of workers processes (one per core by
+    default), storing each one as soon as it finishes. It returns the number of
+    configurations run and skipped."""
+    db = open_database(db_path)
+    done = finished_keys(db)
+    pending = [config for config in configurations(grid) if config_key(config) not in done]
+    skipped = len(configurations(grid)) - len(pending)
+    print("%d configurations, %d already finished" % (len(pending) + skipped, skipped), file = sys.stderr)
+
+    with ProcessPoolExecutor(workers) as executor:
+        futures = {executor.submit(run_config, config) : config for config in pending}
+        for count, future in enumerate(as_completed(futures), 1):
+            config = futures[future]
+            result = future.result()
+            store(db, config, result)
+            print("[%d/%d] %s -> best cost %d (%.1fs)" % (count, len(pending), config_key(config), result["best_cost"], result["wall"]), file = sys.stderr)
+    db.close()
+    return len(pending), skipped
+
+def report(db_path, top = 10):
+    """This function outputs the best parameter sets of the database, by their
+    average best cost over the seeds."""
+    db = open_database(db_path)
+    columns = ", ".join(PARAMETERS[:-1])
+    rows = db.execute("SELECT " + columns + ", COUNT(*), AVG(best_cost), MIN(best_cost) FROM runs GROUP BY " + columns +
+                      " ORDER BY AVG(best_cost) LIMIT ?", (top,)).fetchall()
+    db.close()
+    print("\n" + "  ".join(PARAMETERS[:-1]) + "  seeds  average  lowest")
+    for row in rows:
+        print("  ".join(str(value) for value in row[:-2]) + "  %.1f  %d" % (row[-2], row[-1]))
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Parameter sweep of the genetic algorithm.")
+    parser.add_argument("--p-cross", type = float, nargs = "+", default = [0.8], help = "propabilities of applying crossover")
+    parser.add_argument("--cross-method", type = int, nargs = "+", choices = (1, 2), default = [1], help = "crossover methods")
+    parser.add_argument("--p-mut", type = float, nargs = "+", default = [0.5], help = "propabilities of applying mutation")
+    parser.add_argument("--mut-method", type = int, nargs = "+", choices = (1, 2), default = [1], help = "mutation methods")
+    parser.add_argument("--max-gens", type = int, nargs = "+", default = [10], help = "max generations (population of 2 ** (max_gens - 1))")
+    parser.add_argument("--min-improvement", type = float, nargs = "+", default = [0.0], help = "minimum gen-over-gen percentage")
+    parser.add_argument("--seeds", type = int, nargs = "+", default = [1])
+    parser.add_argument("--workers", type = int, help = "worker processes (default: one per core)")
+    parser.add_argument("--db", default = "sweep.db", help = "SQLite database of the results")
+    parser.add_argument("--top", type = int, default = 10, help = "best parameter sets to output at the end")
+    args = parser.parse_args(argv)
+
+    grid = {"p_cross" : args.p_cross, "cross_method_1" : [method == 1 for method in args.cross_method], "p_mut" : args.p_mut,
+            "mut_method_1" : [method == 1 for method in args.mut_method], "max_gens" : args.max_gens,
+            "min_improvement" : args.min_improvement, "seed" : args.seeds}
+    sweep(grid, args.db, args.workers)
+    report(args.db, args.top)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,636 @@
+"""Tests of the genetic algorithm. The faster implementations of the evaluation
+are checked against a frozen copy of the original per-chromosome checks."""
+
+import random
+
+import numpy as np
+import pytest
+
+import main
+
+# ================== BASELINE CHECKS ==================
+class BaselineChromosome:
+    """This class keeps the original hard and soft constraint checks of the WHPP
+    (before any optimization) unchanged, as the reference of the tests. The grid
+    is a list of lists."""
+
+    def __init__(self, grid, problem = main.WHPP):
+        self.grid = [list(row) for row in np.asarray(grid).tolist()]
+        self.employers = len(self.grid)
+        self.days = len(self.grid[0])
+        self.hard_constraint = problem.hard_constraint
+        self.shift_hours = problem.shift_hours
+        self.max_shifts = problem.max_shifts
+        self.check_hard_constraint()
+        self.check_soft_constraints()
+
+    def check_hard_constraint(self):
+        self.feasible = True
+        day_of_week = 0 # used for repeating weeks
+        for j in range(self.days):
+            # create dict to store shift day_of_week
+            self.employers_per_shift = {}
+
+            # initialize
+            for i in range(self.max_shifts + 1):
+                self.employers_per_shift[i] = 0
+
+            # store shift day_of_week in dict
+            for i in range(self.employers):
+                self.employers_per_shift[self.grid[i][j]] += 1
+
+            # check if chromosome meets hard constraint
+            for m in range(len(self.hard_constraint)):
+                if self.hard_constraint[m][day_of_week] != self.employers_per_shift[m + 1]:
+                    self.feasible = False
+            day_of_week = 0 if day_of_week >= 6 else day_of_week + 1
+
+    def check_soft_constraints(self):
+        # 1. max 70 hours of work (cost = 1000)
+        max_work_hours = 70
+        cost = 1000
+        total_cost = 0
+        for i in range(len(self.grid)):
+            sum_work_hours = 0
+            for j in range(len(self.grid[0])):
+                if self.grid[i][j] != 0:
+                    sum_work_hours += self.shift_hours[self.grid[i][j]]
+            if sum_work_hours > max_work_hours:
+                total_cost += cost
+
+        # 2. max 7 consecutive days of work (cost = 1000)
+        consecutive_days = 7
+        cost = 1000
+        for i in range(self.employers):
+            count = 0
+            for j in range(self.days):
+                if count > consecutive_days:
+                    total_cost += cost
+                    count = 0
+                else:
+                    count = count + 1 if self.grid[i][j] != 0 else 0
+
+        # 3. max 4 consecutive night shifts (cost = 1000)
+        consecutive_night_shifts = 4
+        cost = 1000
+        for i in range(self.employers):
+            count = 0
+            for j in range(self.days):
+                if count > consecutive_night_shifts:
+                    total_cost += cost
+                    count = 0
+                else:
+                    count = count + 1 if self.grid[i][j] == 3 else 0
+
+        # 4. avoid night shift of a day with a morning shift of the next day (cost = 1000)
+        avoid_shift = (3, 1)
+        cost = 1000
+        for i in range(self.employers):
+            for j in range(self.days - 1):
+                if self.grid[i][j] == avoid_shift[0] and self.grid[i][j+1] == avoid_shift[1]:
+                    total_cost += cost
+
+        # 5. avoid afteroon shift of a day with a morning shift of the next day (cost = 800)
+        avoid_shift = (2, 1)
+        cost = 800
+        for i in range(self.employers):
+            for j in range(self.days - 1):
+                if self.grid[i][j] == avoid_shift[0] and self.grid[i][j+1] == avoid_shift[1]:
+                    total_cost += cost
+
+        # 6. avoid night shift of a day with an afteroon shift of the next day (cost = 800)
+        avoid_shift = (3, 2)
+        cost = 800
+        for i in range(self.employers):
+            for j in range(self.days - 1):
+                if self.grid[i][j] == avoid_shift[0] and self.grid[i][j+1] == avoid_shift[1]:
+                    total_cost += cost
+
+        # 7. at least 2 days off after 4 consecutive days of night shifts (cost = 100)
+        consecutive_night_shifts = 4
+        days_off = 2
+        cost = 100
+        for i in range(self.employers):
+            for j in range(self.days - (consecutive_night_shifts + days_off - 1)):
+                temp_consecutive_night_shifts = 0
+                for k in range(consecutive_night_shifts):
+                    if self.grid[i][j+k] == 3:
+                        temp_consecutive_night_shifts += 1
+                if (temp_consecutive_night_shifts == consecutive_night_shifts and (self.grid[i][j+consecutive_night_shifts] != 0 or self.grid[i][j+consecutive_night_shifts+1] != 0)):
+                    total_cost += cost
+
+        # 8. at least 2 days off after 7 days of work (cost = 100)
+        consecutive_days = 7
+        days_off = 2
+        cost = 100
+        for i in range(self.employers):
+            for j in range(self.days - (consecutive_days + days_off - 1)):
+                temp_consecutive_days = 0
+                for k in range(consecutive_days):
+                    if self.grid[i][j+k] != 0:
+                        temp_consecutive_days += 1
+                if temp_consecutive_days == consecutive_days and (self.grid[i][j+temp_consecutive_days] != 0 or self.grid[i][j+temp_consecutive_days+1] != 0):
+                    total_cost += cost
+
+        # 9. avoid day off - work - day off (cost = 1)
+        cost = 1
+        for i in range(self.employers):
+            check = 0
+            for j in range(self.days):
+                if check == 0:
+                    if self.grid[i][j] != 0:
+                        check = 1
+                elif check == 1:
+                    if self.grid[i][j] == 0:
+                        check = 2
+                    else:
+                        check = 0
+                else:
+                    if self.grid[i][j] != 0:
+                        total_cost += cost
+                    check = 0
+
+        # 10. avoid work - day off - work (cost = 1)
+        cost = 1
+        for i in range(self.employers):
+            check = 0
+            for j in range(self.days):
+                if check == 0:
+                    if self.grid[i][j] == 0:
+                        check = 1
+                elif check == 1:
+                    if self.grid[i][j] != 0:
+                        check = 2
+                    else:
+                        check = 0
+                else:
+                    if self.grid[i][j] == 0:
+                        total_cost += cost
+                    check = 0
+
+        # 11. max 1 weekend of work (cost = 1)
+        max_work_weekends = 1
+        cost = 1
+        for i in range(self.employers):
+            day_of_week = 0
+            weekends_worked = 0
+            saturday_worked = False
+            sunday_worked = False
+            for j in range(self.days):
+                if day_of_week == 5 and self.grid[i][j] != 0:
+                    saturday_worked = True
+                if day_of_week == 6 and self.grid[i][j] != 0:
+                    sunday_worked = True
+                if saturday_worked and sunday_worked:
+                    weekends_worked += 1
+                    if weekends_worked > 1:
+                        total_cost += cost
+                if day_of_week >= 6:
+                    day_of_week = 0
+                    saturday_worked = False
+                    sunday_worked = False
+                else:
+                    day_of_week += 1
+
+        self.cost = total_cost
+
+def random_grids(count, employers, days, seed, work = 0.6):
+    """Random (mostly infeasible) grids with the given share of working days."""
+    rng = np.random.default_rng(seed)
+    return np.where(rng.random((count, employers, days)) < work, rng.integers(1, 4, (count, employers, days)), 0).astype(np.uint8)
+
+def baseline_row_costs(grids):
+    """The cost of every row of the given grids by the baseline checks (all of
+    them apply to each employer separately)."""
+    grids = np.asarray(grids)
+    return np.array([BaselineChromosome(row[None]).cost for row in grids.reshape(-1, grids.shape[-1])]).reshape(grids.shape[:-1])
+
+# ================ BATCH EVALUATION ===================
+@pytest.mark.parametrize("days", [1, 3, 7, 9, 14, 28, 40])
+@pytest.mark.parametrize("work", [0.3, 0.6, 0.9])
+def test_soft_constraint_rows_match_baseline(days, work):
+    grids = random_grids(8, 30, days, seed = days, work = work)
+    assert (main.soft_constraint_rows(grids, main.WHPP.shift_hours) == baseline_row_costs(grids)).all()
+
+def test_evaluate_generation_matches_baseline():
+    problem = main.WHPP
+    grids = np.concatenate([random_grids(20, problem.employers, problem.days, seed = 1),
+                            main.generate_grids(20, problem, np.random.default_rng(1))])
+    feasible, costs = main.evaluate_generation(grids, problem.hard_constraint, problem.shift_hours)
+    baseline = [BaselineChromosome(grid) for grid in grids]
+    assert feasible.tolist() == [c.feasible for c in baseline]
+    assert costs.tolist() == [c.cost for c in baseline]
+    assert feasible[20:].all()
+
+# ==================== RULE SCANNER ====================
+@pytest.mark.parametrize("days", [1, 2, 6, 7, 8, 9, 14, 28, 40])
+@pytest.mark.parametrize("work", [0.3, 0.6, 0.9])
+def test_compiled_scanner_matches_baseline(days, work):
+    grids = random_grids(8, 30, days, seed = 100 + days, work = work)
+    scan = main.compile_rules(main.WHPP_RULES, main.WHPP.shift_hours)
+    costs = [[scan(row) for row in grid] for grid in grids.tolist()]
+    assert costs == baseline_row_costs(grids).tolist()
+
+def test_compiled_scanner_is_cached():
+    assert main.compile_rules(main.WHPP_RULES, main.WHPP.shift_hours) is main.WHPP.scanner()
+    assert main.compile_rules(main.WHPP_RULES, {1 : 8, 2 : 8, 3 : 12}) is not main.WHPP.scanner()
+
+def test_chromosome_checks_match_baseline():
+    problem = main.WHPP
+    grids = np.concatenate([random_grids(20, problem.employers, problem.days, seed = 2),
+                            main.generate_grids(20, problem, np.random.default_rng(2))])
+    for grid in grids:
+        chromosome = main.Chromosome.from_grid(0, 0, grid, problem)
+        chromosome.check_hard_constraint()
+        chromosome.check_soft_constraints()
+        baseline = BaselineChromosome(grid)
+        assert (chromosome.feasible, chromosome.cost) == (baseline.feasible, baseline.cost)
+
+# ================ EVALUATION BACKENDS =================
+def rest_after_costs(grids, shifts, days, days_off, cost):
+    """The cost of every row of the given grids by rule 7/8 of the baseline
+    checks, generalized to any shifts and number of days off."""
+    grids = np.asarray(grids)
+    rows = grids.reshape(-1, grids.shape[-1]).tolist()
+    costs = []
+    for row in rows:
+        total_cost = 0
+        for j in range(len(row) - (days + days_off - 1)):
+            if all(row[j+k] in shifts for k in range(days)) and any(row[j+days+k] != 0 for k in range(days_off)):
+                total_cost += cost
+        costs.append(total_cost)
+    return np.array(costs).reshape(grids.shape[:-1])
+
+@pytest.mark.parametrize("backend", main.Problem.BACKENDS)
+@pytest.mark.parametrize("days", [1, 7, 8, 9, 63, 64, 65, 364])
+def test_backends_match_baseline(backend, days):
+    grids = random_grids(2, 30, days, seed = days, work = 0.8)
+    rows = grids.reshape(-1, days)
+    assert main.Problem(backend = backend).evaluate_rows(rows).tolist() == baseline_row_costs(rows).tolist()
+
+@pytest.mark.parametrize("backend", main.Problem.BACKENDS)
+@pytest.mark.parametrize("days", [1, 7, 8, 9, 63, 64, 65, 364])
+@pytest.mark.parametrize("days_off", [1, 3, 5])
+def test_backends_match_rest_after(backend, days, days_off):
+    rules = [{"rule" : "rest_after", "shifts" : [3], "days" : 2, "days_off" : days_off, "cost" : 100},
+             {"rule" : "rest_after", "shifts" : [1, 2, 3], "days" : 4, "days_off" : days_off, "cost" : 7}]
+    rows = random_grids(1, 60, days, seed = days_off * days, work = 0.85)[0]
+    expected = rest_after_costs(rows, [3], 2, days_off, 100) + rest_after_costs(rows, [1, 2, 3], 4, days_off, 7)
+    assert expected.any() or days < 5
+    assert main.Problem(backend = backend, rules = rules).evaluate_rows(rows).tolist() == expected.tolist()
+
+@pytest.mark.parametrize("days", [1, 7, 8, 9, 63, 64, 65, 364])
+def test_backends_agree_on_custom_rules(days):
+    rules = main.WHPP_RULES + [{"rule" : "max_consecutive", "shifts" : [1], "days" : 2, "cost" : 7},
+                               {"rule" : "rest_after", "shifts" : [2, 3], "days" : 3, "days_off" : 3, "cost" : 5},
+                               {"rule" : "avoid_pattern", "working" : [True, True, False], "cost" : 3},
+                               {"rule" : "max_weekends", "weekends" : 0, "cost" : 4}]
+    rows = random_grids(1, 100, days, seed = days, work = 0.7)[0]
+    costs = [main.Problem(backend = backend, rules = rules).evaluate_rows(rows).tolist() for backend in main.Problem.BACKENDS]
+    assert costs[0] == costs[1] == costs[2]
+
+# ================= COMPACT CHROMOSOMES ================
+def evaluated_chromosomes(count, problem = main.WHPP, seed = 1):
+    """count evaluated chromosomes of the first generation."""
+    rng = random.Random(seed)
+    chromosomes = [main.Chromosome(i, 0, problem.employers, problem.days, evaluate = False, problem = problem, rng = rng) for i in range(count)]
+    main.evaluate_chromosomes(chromosomes, problem)
+    return chromosomes
+
+def test_chromosome_memory():
+    # the grid (uint8, ~530 B), the cached row costs (int32, ~230 B) and the
+    # slots (~120 B) of each chromosome, against the ~6.9 KB of the original
+    # list-based chromosomes
+    import gc
+    import tracemalloc
+    count = 500
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    chromosomes = evaluated_chromosomes(count)
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    assert all(c.row_costs is not None and c.row_costs.dtype == np.int32 for c in chromosomes)
+    assert used / count < 1000
+
+@pytest.mark.parametrize("first_method", [True, False])
+def test_no_crossover_child_copies_on_write(first_method):
+    parentA, parentB = evaluated_chromosomes(2)
+    gridA, gridB = parentA.grid.copy(), parentB.grid.copy()
+    rng = random.Random(3)
+    child = main.Chromosome(2, 1, 30, 14, mutation_params = (0.0, first_method), crossover_params = (0.0, True, parentA, parentB), evaluate = False, rng = rng)
+    assert child.grid.flags.writeable == False
+    parent = parentA if np.shares_memory(child.grid, parentA.grid) else parentB
+    assert np.shares_memory(child.grid, parent.grid)
+
+    child.mutate((1.0, first_method), rng)
+    assert child.grid.flags.writeable
+    assert not np.shares_memory(child.grid, parent.grid)
+    assert (child.grid != parent.grid).any()
+    assert (parentA.grid == gridA).all() and (parentB.grid == gridB).all()
+
+# ================== DELTA EVALUATION ==================
+@pytest.mark.parametrize("propability", [1.0, 0.5, 0.0])
+@pytest.mark.parametrize("cross_method_1", [True, False])
+@pytest.mark.parametrize("mut_method_1", [True, False])
+def test_delta_costs_match_full_evaluation(propability, cross_method_1, mut_method_1):
+    # childs of childs reuse the cached row costs of their parents, only the
+    # rows changed by crossover and mutation are evaluated again
+    rng = random.Random(17)
+    pool = evaluated_chromosomes(16, seed = 5)
+    for generation in range(1, 6):
+        childs = []
+        for i in range(len(pool)):
+            parentA, parentB = rng.sample(pool, 2)
+            childs.append(main.Chromosome(i, generation, 30, 14, mutation_params = (propability, mut_method_1), crossover_params = (propability, cross_method_1, parentA, parentB), evaluate = False, rng = rng))
+        for c in childs[::2]:
+            c.update_cost()
+        main.evaluate_chromosomes(childs[1::2], main.WHPP)
+        for c in childs:
+            full = main.Chromosome.from_grid(c.id, generation, c.grid.copy(), main.WHPP)
+            full.check_soft_constraints()
+            assert c.cost == full.cost
+            assert c.row_costs.tolist() == main.soft_constraint_rows(c.grid, main.WHPP.shift_hours).tolist()
+            assert c.stale_rows().size == 0
+        pool = childs
+
+# =================== FITNESS CACHE ====================
+def test_fitness_cache_evicts_least_recently_used():
+    cache = main.FitnessCache(3)
+    for key in (b"a", b"b", b"c"):
+        cache.store(key, True, 0, None)
+    assert cache.lookup(b"a") is not None # "b" is now the least recently used
+    cache.store(b"d", True, 0, None)
+    assert list(cache.entries) == [b"c", b"a", b"d"]
+    assert cache.lookup(b"b") is None
+    cache.store(b"c", False, 1, None) # storing again refreshes an entry
+    cache.store(b"e", True, 0, None)
+    assert list(cache.entries) == [b"d", b"c", b"e"]
+    assert cache.entries[b"c"] == (False, 1, None)
+    assert (cache.hits, cache.misses, cache.evictions) == (1, 1, 2)
+
+def test_evaluate_chromosomes_with_cache():
+    problem = main.WHPP
+    grids = main.generate_grids(6, problem, np.random.default_rng(8))
+    order = [0, 1, 2, 0, 3, 4, 1, 5, 0] # grids repeated within the generation
+    cache = main.FitnessCache(4)
+    chromosomes = [main.Chromosome.from_grid(i, 0, grids[k].copy(), problem) for i, k in enumerate(order)]
+    main.evaluate_chromosomes(chromosomes, problem, cache)
+    expected = [BaselineChromosome(grids[k]).cost for k in order]
+    assert [c.cost for c in chromosomes] == expected
+    # the 3 repeats are hits without a lookup, the 6 distinct grids are
+    # looked up and stored, the first 2 of them are evicted
+    assert (cache.hits, cache.misses, cache.evictions) == (3, 6, 2)
+    assert len(cache.entries) == 4
+
+    chromosomes = [main.Chromosome.from_grid(i, 1, grids[k].copy(), problem) for i, k in enumerate(range(6))]
+    main.evaluate_chromosomes(chromosomes, problem, cache)
+    assert [c.cost for c in chromosomes] == [BaselineChromosome(grid).cost for grid in grids]
+    assert (cache.hits, cache.misses, cache.evictions) == (3 + 4, 6 + 2, 2 + 2)
+    assert all(c.row_costs.sum() == c.cost and c.stale_rows().size == 0 for c in chromosomes)
+
+def test_population_cache_stats():
+    population = main.Population(64, (0.0, True), (0.0, True), -1, seed = 3, report = False, engine = "steady", max_generations = 3, cache_size = 16)
+    stats = population.cache_stats()
+    # without crossover and mutation every child repeats a grid of its parents
+    assert stats["hits"] > 0 and stats["evictions"] == stats["misses"] - len(population.cache.entries)
+
+# ====================== DIVERSITY ======================
+@pytest.mark.parametrize("count", [1, 2, 5, 17])
+def test_hamming_diversity_matches_pairwise_mean(count):
+    grids = random_grids(count, 30, 14, seed = count)
+    grids[count // 2:] = grids[0] # some identical grids
+    distances = [(grids[a] != grids[b]).mean() for a in range(count) for b in range(count) if a != b]
+    assert main.hamming_diversity(grids) == pytest.approx(np.mean(distances) if distances else 0.0)
+
+def test_generation_diversity():
+    chromosomes = evaluated_chromosomes(4)
+    chromosomes.append(main.Chromosome.from_grid(4, 0, chromosomes[0].grid.copy(), main.WHPP))
+    assert main.generation_diversity(chromosomes) == 4 / 5
+    assert main.generation_diversity(chromosomes, "hamming") == pytest.approx(main.hamming_diversity(np.stack([c.grid for c in chromosomes])))
+
+@pytest.mark.parametrize("elites", [0, 2])
+def test_replace_duplicates_makes_generation_unique(elites):
+    population = main.Population(16, (0.0, True), (0.0, True), -1, seed = 9, report = False, run = False)
+    pool = population.generations[-1]
+    others = pool[:elites]
+    rng = random.Random(9)
+    # without crossover and mutation every child repeats one of the 2 parents
+    childs = [main.Chromosome(16 + i, 1, 30, 14, mutation_params = (0.0, True), crossover_params = (0.0, True, pool[i % 2], pool[2 + i % 2]), evaluate = False, rng = rng) for i in range(12)]
+    main.evaluate_chromosomes(childs, population.problem)
+    replaced = population.replace_duplicates(childs, others)
+    keys = [main.FitnessCache.key(c.grid) for c in others + childs]
+    assert replaced > 0 and len(set(keys)) == len(keys)
+    for c in childs:
+        full = main.Chromosome.from_grid(c.id, 1, c.grid.copy(), population.problem)
+        full.check_hard_constraint()
+        full.check_soft_constraints()
+        assert full.feasible and c.cost == full.cost
+
+def test_min_diversity_stops_the_run():
+    # without crossover and mutation the childs are copies of their parents,
+    # so the ratio of distinct grids falls quickly
+    population = main.Population(64, (0.0, True), (0.0, True), -1, seed = 10, report = False, engine = "steady", max_generations = 100, min_diversity = 0.5)
+    assert population.finished and population.generation < 100
+    assert population.diversity_history[-1] < 0.5 <= min(population.diversity_history[:-1])
+
+# ================= BATCHED OPERATORS ==================
+SAMPLES = 3000
+
+def operator_parents(costs):
+    """Two feasible parents whose grids differ in every day (column)."""
+    grids = main.generate_grids(2, main.WHPP, np.random.default_rng(4))
+    assert (grids[0] != grids[1]).any(axis = 0).all()
+    return [main.Chromosome.from_grid(i, 0, grids[i], main.WHPP, costs[i]) for i in range(2)]
+
+def days_from_B(grids, parentA, parentB):
+    # the share of the childs copying each day (column) from parent B
+    from_B = (grids == parentB.grid).all(axis = -2)
+    assert (from_B | (grids == parentA.grid).all(axis = -2)).all()
+    return from_B.mean(axis = 0)
+
+@pytest.mark.parametrize("propability", [1.0, 0.6])
+@pytest.mark.parametrize("first_method", [True, False])
+@pytest.mark.parametrize("costs", [(100, 200), (150, 150)])
+def test_crossover_grids_follows_crossover(propability, first_method, costs):
+    parentA, parentB = operator_parents(costs)
+    rng = random.Random(5)
+    childs = np.stack([main.Chromosome(i, 1, 30, 14, mutation_params = (0.0, True), crossover_params = (propability, first_method, parentA, parentB), evaluate = False, rng = rng).grid for i in range(SAMPLES)])
+    grids = main.crossover_grids(np.stack([parentA.grid] * SAMPLES), np.stack([parentB.grid] * SAMPLES), [costs[0]] * SAMPLES, [costs[1]] * SAMPLES,
+                                 (propability, first_method), np.random.default_rng(5))
+    assert np.abs(days_from_B(grids, parentA, parentB) - days_from_B(childs, parentA, parentB)).max() < 0.06
+    if costs[0] == costs[1]:
+        # parents with equal costs stay on A after a crossover index
+        assert days_from_B(grids, parentA, parentB)[1:].max() <= days_from_B(grids, parentA, parentB)[0] + 0.05
+
+def mutated_days(grids, parent):
+    # the share of the grids with each day (column) changed, and reversed
+    changed = (grids != parent.grid).any(axis = -2).mean(axis = 0)
+    reversed_days = (grids == parent.grid[::-1]).all(axis = -2).mean(axis = 0)
+    return changed, reversed_days
+
+@pytest.mark.parametrize("propability", [1.0, 0.5])
+@pytest.mark.parametrize("first_method", [True, False])
+def test_mutate_grids_follows_mutate(propability, first_method):
+    parent = operator_parents((0, 0))[0]
+    assert ((parent.grid != parent.grid[::-1]).any(axis = 0)).all()
+    rng = random.Random(6)
+    childs = []
+    for i in range(SAMPLES):
+        child = main.Chromosome.from_grid(i, 1, parent.grid.copy(), main.WHPP)
+        child.mutate((propability, first_method), rng)
+        childs.append(child.grid)
+    grids = np.stack([parent.grid] * SAMPLES)
+    main.mutate_grids(grids, (propability, first_method), np.random.default_rng(6))
+    for expected, actual in zip(mutated_days(np.stack(childs), parent), mutated_days(grids, parent)):
+        assert np.abs(expected - actual).max() < 0.06
+    if not first_method:
+        # a day is reversed with a 80% chance
+        assert abs(mutated_days(grids, parent)[1].mean() - 0.8 * propability) < 0.03
+
+def test_operators_keep_the_hard_constraint():
+    problem = main.WHPP
+    generator = np.random.default_rng(7)
+    rng = random.Random(7)
+    pool = evaluated_chromosomes(32, seed = 7)
+    gridsA = np.stack([c.grid for c in pool[:16]])
+    gridsB = np.stack([c.grid for c in pool[16:]])
+    for first_method in (True, False):
+        grids = main.crossover_grids(gridsA, gridsB, [c.cost for c in pool[:16]], [c.cost for c in pool[16:]], (1.0, first_method), generator)
+        assert main.check_hard_constraints(grids, problem.hard_constraint).all()
+        main.mutate_grids(grids, (1.0, first_method), generator)
+        assert main.check_hard_constraints(grids, problem.hard_constraint).all()
+        pairs = [(i, i + 16) for i in range(16)]
+        childs = main.breed_generation(problem, pool, pairs, 32, 1, (0.8, first_method), (0.5, first_method), generator)
+        childs += [main.Chromosome(i, 1, 30, 14, mutation_params = (1.0, first_method), crossover_params = (1.0, first_method, pool[i], pool[i + 16]), evaluate = False, rng = rng) for i in range(16)]
+        for c in childs:
+            c.check_hard_constraint()
+            assert c.feasible
+            c.update_cost()
+            c.local_search(50, rng)
+            c.check_hard_constraint()
+            assert c.feasible
+
+# ================== PARALLEL BREEDING ==================
+def generation_grids(population):
+    return [[(c.id, c.cost, c.grid.tobytes()) for c in generation] for generation in population.generations]
+
+@pytest.mark.parametrize("engine", ["halving", "steady"])
+def test_workers_do_not_change_the_results(engine):
+    # every child is bred with its own seed, whichever process breeds it
+    runs = [main.Population(32, (0.8, True), (0.5, True), -1, seed = 7, report = False, engine = engine, max_generations = 6, workers = workers)
+            for workers in (1, 3)]
+    assert runs[0].history == runs[1].history
+    assert generation_grids(runs[0]) == generation_grids(runs[1])
+
+# ==================== ISLAND MODEL ====================
+@pytest.mark.parametrize("topology", main.IslandModel.TOPOLOGIES)
+def test_island_model_is_reproducible(topology):
+    import multiprocessing
+    runs = []
+    for i in range(2):
+        model = main.IslandModel(3, 32, (0.8, True), (0.5, True), -1, migration_size = 2, migration_interval = 2, topology = topology, seed = 5, engine = "steady", max_generations = 6)
+        best = model.run()
+        runs.append((model.stats, model.best_island, best.cost, best.grid.tobytes()))
+    assert runs[0] == runs[1]
+    assert all(len(stats) == 7 for stats in runs[0][0])
+    assert multiprocessing.active_children() == []
+
+island_process = main.island_process
+
+def failing_island(conn, pop_size, crossover_params, mutation_params, min_gen_improvement, problem, seed, migration_size, options):
+    """An island process failing in its first epoch when it is the second
+    island of a model seeded with 5."""
+    if seed == main.child_seed(5, 0, 1):
+        crossover_params = (crossover_params[0],) # the missing method fails the breeding
+    island_process(conn, pop_size, crossover_params, mutation_params, min_gen_improvement, problem, seed, migration_size, options)
+
+def dying_island(conn, pop_size, crossover_params, mutation_params, min_gen_improvement, problem, seed, migration_size, options):
+    """An island process exiting without a reply when it is the second island
+    of a model seeded with 5."""
+    import os
+    if seed == main.child_seed(5, 0, 1):
+        os._exit(1)
+    island_process(conn, pop_size, crossover_params, mutation_params, min_gen_improvement, problem, seed, migration_size, options)
+
+@pytest.mark.parametrize("island, crossover_params, error", [(failing_island, (0.8,), "island [01] failed"),
+                                                             (failing_island, (0.8, True), "island 1 failed"),
+                                                             (dying_island, (0.8, True), "island 1 stopped without a reply")])
+def test_island_model_failure_stops_every_island(monkeypatch, island, crossover_params, error):
+    # every island fails, or only one while the others keep running
+    import multiprocessing
+    monkeypatch.setattr(main, "island_process", island)
+    model = main.IslandModel(3, 16, crossover_params, (0.5, True), -1, migration_interval = 1, seed = 5, engine = "steady", max_generations = 50)
+    with pytest.raises(RuntimeError, match = error):
+        model.run()
+    assert multiprocessing.active_children() == []
+
+# ===================== TIME BUDGET =====================
+@pytest.mark.parametrize("pop_size, problem, budget, options", [(1024, main.Problem.scaled(100, 28), 1.0, {"engine" : "halving"}),
+                                                                (512, main.WHPP, 0.5, {"engine" : "steady", "max_generations" : 1000}),
+                                                                (512, main.WHPP, 0.5, {"engine" : "steady", "max_generations" : 1000, "batch" : True}),
+                                                                (512, main.WHPP, 0.5, {"engine" : "steady", "max_generations" : 1000, "local_search" : 4})])
+def test_time_budget_is_kept(pop_size, problem, budget, options):
+    # no generation is started when it would not finish before the deadline,
+    # the budget is counted from the creation of the population
+    import time
+    start = time.perf_counter()
+    population = main.Population(pop_size, (0.8, True), (0.5, True), -1, problem = problem, seed = 1, report = False, time_budget = budget, **options)
+    assert time.perf_counter() - start < budget
+    assert population.finished and population.generation < {"halving" : pop_size.bit_length() - 1, "steady" : 1000}[options["engine"]]
+    assert population.generation >= 1 or options["engine"] == "halving"
+
+def test_run_time_budget_is_kept():
+    import time
+    population = main.Population(1024, (0.8, True), (0.5, True), -1, seed = 1, report = False, run = False, engine = "steady", max_generations = 1000)
+    start = time.perf_counter()
+    best = population.run(0.3)
+    assert time.perf_counter() - start < 0.3
+    assert best is population.best_chromosome and population.finished and population.generation < 1000
+
+# ===================== CHECKPOINTS =====================
+def fingerprint(population):
+    return (population.history, population.generation, population.best_chromosome.cost, population.best_chromosome.id,
+            [(c.id, c.generation, c.cost, c.grid.tobytes()) for generation in population.generations for c in generation])
+
+@pytest.mark.parametrize("options", [{"engine" : "steady", "max_generations" : 10},
+                                     {"engine" : "steady", "max_generations" : 10, "batch" : True},
+                                     {"engine" : "steady", "max_generations" : 10, "deduplicate" : True, "local_search" : 2, "local_search_moves" : 20},
+                                     {"engine" : "halving"}])
+def test_resumed_run_matches_uninterrupted_run(tmp_path, options):
+    import shutil
+    path = str(tmp_path / "run.ckpt")
+    copy = str(tmp_path / "generation4.ckpt")
+    population = main.Population(64, (0.8, True), (0.5, True), -1, seed = 11, report = False, run = False, checkpoint = path, checkpoint_interval = 4, **options)
+    while population.step():
+        if population.generation == 4:
+            shutil.copy(path, copy)
+    assert population.generation > 4
+
+    resumed = main.Population.resume(copy, report = False, run = False)
+    assert resumed.generation == 4
+    resumed.run()
+    assert resumed.history == population.history
+    assert fingerprint(resumed) == fingerprint(population)
+
+def test_checkpoint_round_trip(tmp_path):
+    path = str(tmp_path / "arrays.ckpt")
+    arrays = {"grids" : random_grids(3, 30, 14, seed = 1), "costs" : np.arange(3, dtype = np.int64) * 1000,
+              "feasible" : np.array([True, False, True]), "improvements" : np.linspace(-1, 1, 3), "empty" : np.zeros((0, 14), dtype = np.uint8)}
+    header = {"state" : {"generation" : 4, "history" : [[3, 0, 1000, 2000]]}, "name" : "round trip"}
+    main.write_checkpoint(path, header, arrays)
+    read_header, read_arrays = main.read_checkpoint(path)
+    assert read_header == header
+    assert sorted(read_arrays) == sorted(arrays)
+    for name in arrays:
+        if arrays[name].size:
+            assert isinstance(read_arrays[name], np.memmap)
+            assert not read_arrays[name].flags.writeable
+        assert read_arrays[name].dtype == arrays[name].dtype and read_arrays[name].shape == arrays[name].shape
+        assert (read_arrays[name] == arrays[name]).all()
+
+def test_read_checkpoint_rejects_other_files(tmp_path):
+    path = tmp_path / "other.ckpt"
+    path.write_bytes(b"not a checkpoint file")
+    with pytest.raises(ValueError):
+        main.read_checkpoint(str(path))